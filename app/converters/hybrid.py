@@ -1,53 +1,153 @@
 from __future__ import annotations
 
+import os
+import shutil
 import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from app.env import env_int
 from app.converters.pandoc_converter import PandocConverter, ConversionResult, ConversionError
+from app.services.admission import PANDOC_BASE_MB, PANDOC_XML_FACTOR
+from app.services.docx_inspect import DocxInspection, inspect
 from app.services.image_store import ImageStore
+from app.services.image_meta import describe_asset
 from app.services.html_postprocess import process_all
+from app.services.pandoc_ast import ANCHOR_PROBE, merge_parts, render_html
 import re
+from xml.sax.saxutils import quoteattr
+
+
+# "html": Pandoc HTML writer + regex post-processing (default)
+# "ast":  Pandoc JSON AST + typed passes + built-in writer
+# "auto": chosen per document from its inspection
+DEFAULT_PIPELINE = os.getenv("FEI2HTML_PIPELINE", "html")
+# Opt-in: with "ast" or "auto", documents whose word/document.xml is larger
+# than this are converted in parts of about this size split at top-level
+# headings (check with scripts/compare_split.py); 0 (default) disables
+SPLIT_XML_MB = max(0, env_int("CONVERT_SPLIT_XML_MB", 0))
+MAX_SPLIT_PARTS = 16
 
 
 @dataclass
 class HybridResult:
     html: str
-    assets: List[Dict[str, str]]
+    # name, url, digest, size, mime, width, height
+    assets: List[Dict[str, Any]]
     engine: str
 
 
+@dataclass
+class ConversionPlan:
+    """How a document will be converted, decided from its inspection."""
+
+    pipeline: str
+    # Split points (byte offsets in word/document.xml); empty: one Pandoc run
+    offsets: List[int]
+    # Pandoc processes run at once; also the number of admission slots held
+    workers: int
+    # Estimated peak Pandoc memory with `workers` parts in flight
+    memory_mb: int
+    inspection: DocxInspection
+
+    @property
+    def parts(self) -> int:
+        return len(self.offsets) + 1
+
+
 class HybridConverter:
-    def __init__(self, image_store: ImageStore, timeout_sec: int = 180):
+    def __init__(self, image_store: ImageStore, timeout_sec: int = 180, pipeline: Optional[str] = None):
         self.image_store = image_store
         self.timeout_sec = timeout_sec
+        self.pipeline = (pipeline or DEFAULT_PIPELINE).lower()
+        if self.pipeline not in ("html", "ast", "auto"):
+            raise ValueError(f"Unknown pipeline: {self.pipeline}")
 
-    def convert_docx(self, docx_path: Path, doc_id: Optional[str] = None) -> HybridResult:
+    def plan(self, docx_path: Path, max_workers: Optional[int] = None) -> ConversionPlan:
+        """Inspect the document and pick the pipeline, split points and worker count."""
+
+        insp = inspect(docx_path)
+        cost = insp.cost
+        large = SPLIT_XML_MB > 0 and insp.document_xml_bytes > SPLIT_XML_MB << 20
+        pipeline = self.pipeline
+        if pipeline == "auto":
+            pipeline = "ast" if large else "html"
+        offsets: List[int] = []
+        # Parts are merged at the AST level (merge_parts), where heading ids,
+        # internal links and footnote numbers are made consistent across them
+        if large and pipeline == "ast":
+            parts = min(MAX_SPLIT_PARTS, -(-insp.document_xml_bytes // (SPLIT_XML_MB << 20)))
+            offsets = insp.split_offsets(parts)
+        workers = min(len(offsets) + 1, os.cpu_count() or 1, max_workers or MAX_SPLIT_PARTS)
+        part_xml = cost.xml_bytes - insp.document_xml_bytes + insp.document_xml_bytes // (len(offsets) + 1)
+        part_mb = int(PANDOC_BASE_MB + (PANDOC_XML_FACTOR * part_xml + cost.media_bytes) / (1 << 20))
+        return ConversionPlan(pipeline, offsets, max(1, workers), max(1, workers) * part_mb, insp)
+
+    def convert_docx(self, docx_path: Path, doc_id: Optional[str] = None, plan: Optional[ConversionPlan] = None) -> HybridResult:
         doc_id = doc_id or docx_path.stem
+        plan = plan or self.plan(docx_path)
 
-        # Try Pandoc first
         with tempfile.TemporaryDirectory() as tmpdir:
-            media_dir = Path(tmpdir) / "media"
             converter = PandocConverter(timeout_sec=self.timeout_sec)
-            result = converter.convert(docx_path=docx_path, media_out_dir=media_dir)
+            if plan.offsets:
+                runs = self._convert_parts(converter, docx_path, plan, Path(tmpdir))
+            else:
+                media_dir = (Path(tmpdir) / "media").resolve()
+                if plan.pipeline == "ast":
+                    result = converter.convert_ast(docx_path=docx_path, media_out_dir=media_dir)
+                else:
+                    result = converter.convert(docx_path=docx_path, media_out_dir=media_dir)
+                runs = [(result, media_dir)]
 
             # Upload assets and rewrite HTML <img> src
-            uploads: List[Dict[str, str]] = []
+            uploads: List[Dict[str, Any]] = []
             local_to_url: Dict[str, str] = {}
-            for idx, asset in enumerate(result.assets):
-                local = Path(asset["local_path"]).resolve()
-                if not local.exists():
-                    continue
-                dest_rel = Path(doc_id) / local.name
-                url = self.image_store.save(local, dest_rel)
-                uploads.append({"name": asset["name"], "url": url})
-                local_to_url[str(local)] = url
-
-            html = self._rewrite_img_srcs(result.html, local_to_url)
-            html = process_all(html)
+            # Parts extract the same media files under their own directories
+            uploaded: Dict[Path, str] = {}
+            for result, media_dir in runs:
+                for asset in result.assets:
+                    local = Path(asset["local_path"]).resolve()
+                    if not local.exists():
+                        continue
+                    # Keep sub-directories so same-named media files don't collide
+                    rel_parts = local.relative_to(media_dir).parts
+                    if len(rel_parts) > 1 and rel_parts[0] == "media":
+                        rel_parts = rel_parts[1:]
+                    dest_rel = Path(doc_id, *rel_parts)
+                    if dest_rel not in uploaded:
+                        uploaded[dest_rel] = self.image_store.save(local, dest_rel)
+                        uploads.append({"name": asset["name"], "url": uploaded[dest_rel], **describe_asset(local)})
+                    local_to_url[str(local)] = uploaded[dest_rel]
+
+            result = runs[0][0]
+            if result.ast is not None:
+                ast = result.ast
+                if len(runs) > 1:
+                    ast = merge_parts([r.ast for r, _ in runs], plan.inspection.link_anchors)
+                html = render_html(ast, local_to_url)
+            else:
+                html = self._rewrite_img_srcs(result.html, local_to_url)
+                html = process_all(html)
             return HybridResult(html=html, assets=uploads, engine=result.engine)
 
+    def _convert_parts(
+        self, converter: PandocConverter, docx_path: Path, plan: ConversionPlan, tmpdir: Path
+    ) -> List[Tuple[ConversionResult, Path]]:
+        """Convert each part to an AST, `plan.workers` at a time, in document order."""
+
+        paths = _write_parts(docx_path, plan.inspection, plan.offsets, tmpdir)
+
+        def run(idx_path: Tuple[int, Path]) -> Tuple[ConversionResult, Path]:
+            idx, path = idx_path
+            media_dir = (tmpdir / f"media{idx}").resolve()
+            return converter.convert_ast(docx_path=path, media_out_dir=media_dir), media_dir
+
+        with ThreadPoolExecutor(max_workers=plan.workers) as pool:
+            return list(pool.map(run, enumerate(paths)))
+
     def _rewrite_img_srcs(self, html: str, mapping: Dict[str, str]) -> str:
         # Build a filename->url map for best-effort replacement
         name_map: Dict[str, str] = {}
@@ -58,11 +158,67 @@ class HybridConverter:
         def repl(match):
             quote = match.group(1)
             src = match.group(2)
-            filename = Path(src).name
-            new = name_map.get(filename)
+            # Exact media path first; basename only as a fallback
+            new = mapping.get(src) or name_map.get(Path(src).name)
             if new:
                 return f"src={quote}{new}{quote}"
             return match.group(0)
 
         pattern = re.compile(r"src=(['\"])([^'\"]+)\1", re.IGNORECASE)
         return pattern.sub(repl, html)
+
+
+def _write_parts(docx_path: Path, inspection: DocxInspection, offsets: List[int], out_dir: Path) -> List[Path]:
+    """Copies of the .docx whose bodies are the slices of document.xml between `offsets`.
+
+    Every part keeps the XML before and after the body (namespaces, final
+    section properties) and all other zip entries, so relationships, styles,
+    numbering and footnotes still resolve. Only document.xml is held in
+    memory; every other entry is streamed from the source into each part.
+    """
+
+    start, end = inspection.body_range
+    bounds = [start, *offsets, end]
+    paths: List[Path] = []
+    with zipfile.ZipFile(docx_path) as zin:
+        xml = zin.read("word/document.xml")
+        probe = _anchor_probe(xml[:start], inspection.link_anchors)
+        entries = [info for info in zin.infolist() if info.filename != "word/document.xml"]
+        for idx in range(len(bounds) - 1):
+            path = out_dir / f"part{idx}.docx"
+            with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zout:
+                for info in entries:
+                    _copy_entry(zin, zout, info)
+                zout.writestr("word/document.xml", xml[:start] + xml[bounds[idx]:bounds[idx + 1]] + probe + xml[end:])
+            paths.append(path)
+    return paths
+
+
+def _copy_entry(zin: zipfile.ZipFile, zout: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    out = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    # Media is already compressed
+    out.compress_type = zipfile.ZIP_STORED if info.filename.startswith("word/media/") else zipfile.ZIP_DEFLATED
+    out.file_size = info.file_size
+    with zin.open(info) as src, zout.open(out, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dest:
+        shutil.copyfileobj(src, dest, 1 << 16)
+
+
+_BODY_PREFIX_RE = re.compile(rb"<(\w+):body\b")
+
+
+def _anchor_probe(head: bytes, anchors: List[str]) -> bytes:
+    """Last paragraph for each part, linking to every bookmark that internal links target.
+
+    Pandoc points links to a heading's bookmark at the heading's id, but only
+    within one run; `merge_parts` reads the probe back to resolve links
+    across parts, and removes it.
+    """
+
+    m = _BODY_PREFIX_RE.search(head)
+    if not anchors or not m:
+        return b""
+    w = m.group(1).decode()
+    links = "".join(
+        f"<{w}:hyperlink {w}:anchor={quoteattr(a)}><{w}:r><{w}:t>.</{w}:t></{w}:r></{w}:hyperlink>" for a in anchors
+    )
+    return f"<{w}:p><{w}:r><{w}:t>{ANCHOR_PROBE}</{w}:t></{w}:r>{links}</{w}:p>".encode("utf-8")
@@ -1,10 +1,23 @@
 from __future__ import annotations
 
+import json
+import os
+import shutil
+import signal
 import subprocess
 import tempfile
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
+
+from app.env import env_int
+
+
+# pandoc-types 1.21 (Pandoc 2.10) introduced the current Table representation
+MIN_AST_API_VERSION = (1, 21)
+# Pandoc (GHC runtime) exits with 251 when the heap limit (+RTS -M) is hit
+_PANDOC_OOM_EXIT = 251
 
 
 @dataclass
@@ -12,66 +25,205 @@ class ConversionResult:
     html: str
     assets: List[Dict[str, str]]
     engine: str
+    ast: Optional[Dict[str, Any]] = None
 
 
 class ConversionError(Exception):
     pass
 
 
+class ResourceLimitExceeded(ConversionError):
+    """Pandoc was stopped by one of its limits (`limit`: memory, cpu or file_size)."""
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+@dataclass
+class ResourceLimits:
+    """Limits for the Pandoc subprocess; None or 0 disables one."""
+
+    memory_mb: Optional[int] = 2048
+    cpu_sec: Optional[int] = 120
+    file_size_mb: Optional[int] = 256
+
+    @classmethod
+    def from_env(cls) -> "ResourceLimits":
+        return cls(
+            memory_mb=env_int("CONVERT_MAX_MEMORY_MB", cls.memory_mb),
+            cpu_sec=env_int("CONVERT_MAX_CPU_SEC", cls.cpu_sec),
+            file_size_mb=env_int("CONVERT_MAX_FILE_MB", cls.file_size_mb),
+        )
+
+    def command(self, pandoc: str, args: List[str]) -> List[str]:
+        """The Pandoc command line with the limits applied.
+
+        Nothing runs in the child between fork and exec (no preexec_fn, which
+        isn't safe with other threads running): memory is capped by Pandoc's
+        own GHC runtime (`+RTS -M`), CPU time and file size by util-linux
+        `prlimit` wrapping the command. Where `prlimit` is missing only the
+        conversion timeout bounds CPU time.
+        """
+
+        cmd = [pandoc]
+        rlimits = []
+        if self.memory_mb:
+            if _accepts_rts_opts(pandoc):
+                cmd += ["+RTS", f"-M{self.memory_mb}m", "-RTS"]
+            else:
+                rlimits.append(("as", "RLIMIT_AS", self.memory_mb << 20, self.memory_mb << 20))
+        if self.cpu_sec:
+            # SIGXCPU at the soft limit, SIGKILL shortly after
+            rlimits.append(("cpu", "RLIMIT_CPU", self.cpu_sec, self.cpu_sec + 5))
+        if self.file_size_mb:
+            rlimits.append(("fsize", "RLIMIT_FSIZE", self.file_size_mb << 20, self.file_size_mb << 20))
+        cmd += args
+        prlimit = _probe_prlimit()
+        if not rlimits or not prlimit:
+            return cmd
+        return [prlimit, *(f"--{opt}={soft}:{hard}" for opt, soft, hard in _clamp(rlimits)), "--", *cmd]
+
+
+def _clamp(rlimits: List[tuple]) -> List[tuple]:
+    # Raising a hard limit needs privileges: stay within the current ones
+    try:
+        import resource
+    except ImportError:
+        return [(opt, soft, hard) for opt, _, soft, hard in rlimits]
+    clamped = []
+    for opt, name, soft, hard in rlimits:
+        cur_hard = resource.getrlimit(getattr(resource, name))[1]
+        if cur_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, cur_hard), min(hard, cur_hard)
+        clamped.append((opt, soft, hard))
+    return clamped
+
+
+@lru_cache(maxsize=1)
+def _probe_prlimit() -> Optional[str]:
+    return shutil.which("prlimit") if os.name == "posix" else None
+
+
+@lru_cache(maxsize=None)
+def _accepts_rts_opts(pandoc: str) -> bool:
+    """Whether this Pandoc build takes GHC runtime options (official builds do)."""
+
+    try:
+        out = subprocess.run([pandoc, "+RTS", "-M256m", "-RTS", "--version"], capture_output=True, timeout=10)
+    except Exception:
+        return False
+    return out.returncode == 0
+
+
+@lru_cache(maxsize=1)
+def _probe_pandoc() -> Optional[str]:
+    """Locate a working pandoc binary once per process.
+
+    Returns the executable path, or None if pandoc is missing or broken.
+    """
+
+    path = shutil.which("pandoc")
+    if not path:
+        return None
+    try:
+        out = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10)
+    except Exception:
+        return None
+    return path if out.returncode == 0 else None
+
+
 class PandocConverter:
-    def __init__(self, timeout_sec: int = 180):
+    def __init__(self, timeout_sec: int = 180, limits: Optional[ResourceLimits] = None):
         self.timeout_sec = timeout_sec
-        self._pandoc_path = self._detect_pandoc()
+        self.limits = limits or ResourceLimits.from_env()
+        self._pandoc_path: Optional[str] = None
 
     def _detect_pandoc(self) -> str:
-        try:
-            out = subprocess.run(["pandoc", "--version"], capture_output=True, text=True, timeout=10)
-            if out.returncode == 0:
-                return "pandoc"
-        except Exception as e:
-            raise ConversionError(f"Pandoc not available: {e}")
-        raise ConversionError("Pandoc not available in PATH")
+        # Deferred to the first conversion; the probe result is cached
+        if self._pandoc_path is None:
+            path = _probe_pandoc()
+            if not path:
+                raise ConversionError("Pandoc not available in PATH")
+            self._pandoc_path = path
+        return self._pandoc_path
 
     def convert(self, docx_path: Path, media_out_dir: Path, mathjax: bool = True) -> ConversionResult:
+        extra = ["--to", "html5"]
+        if mathjax:
+            extra.extend(["--mathjax"])
+        html, assets = self._run(docx_path, media_out_dir, extra)
+        return ConversionResult(html=html, assets=assets, engine="pandoc")
+
+    def convert_ast(self, docx_path: Path, media_out_dir: Path) -> ConversionResult:
+        """Convert to Pandoc's JSON AST instead of HTML (`result.ast`, empty `html`)."""
+
+        out, assets = self._run(docx_path, media_out_dir, ["--to", "json"])
+        try:
+            ast = json.loads(out)
+        except ValueError as e:
+            raise ConversionError(f"Pandoc returned invalid JSON: {e}") from e
+        version = tuple(ast.get("pandoc-api-version") or ())
+        if version[:2] < MIN_AST_API_VERSION:
+            raise ConversionError(
+                f"Pandoc AST API {'.'.join(map(str, version)) or 'unknown'} is too old; need >= 1.21 (Pandoc 2.10)"
+            )
+        return ConversionResult(html="", assets=assets, engine="pandoc", ast=ast)
+
+    def _run(self, docx_path: Path, media_out_dir: Path, extra_args: List[str]):
         if not docx_path.exists():
             raise ConversionError(f"File not found: {docx_path}")
 
+        pandoc = self._detect_pandoc()
         media_out_dir.mkdir(parents=True, exist_ok=True)
 
         args = [
-            self._pandoc_path,
             "--from",
             "docx",
-            "--to",
-            "html5",
+            *extra_args,
             "--wrap",
             "none",
             "--extract-media",
             str(media_out_dir),
+            str(docx_path),
         ]
 
-        if mathjax:
-            args.extend(["--mathjax"])
-
-        args.append(str(docx_path))
-
         try:
-            proc = subprocess.run(args, capture_output=True, text=True, timeout=self.timeout_sec)
+            proc = subprocess.run(
+                self.limits.command(pandoc, args),
+                capture_output=True,
+                text=True,
+                timeout=self.timeout_sec,
+            )
         except subprocess.TimeoutExpired as e:
             raise ConversionError(f"Pandoc timed out after {self.timeout_sec}s") from e
         except Exception as e:
             raise ConversionError(f"Pandoc execution failed: {e}") from e
 
         if proc.returncode != 0:
+            self._raise_for_limit(proc)
             raise ConversionError(f"Pandoc failed: {proc.stderr.strip()}")
 
-        html = proc.stdout
-
         # Collect extracted assets under media_out_dir
         assets: List[Dict[str, str]] = []
         for p in media_out_dir.rglob("*"):
             if p.is_file():
                 assets.append({"local_path": str(p), "name": p.name})
 
-        return ConversionResult(html=html, assets=assets, engine="pandoc")
-
+        return proc.stdout, assets
+
+    def _raise_for_limit(self, proc: subprocess.CompletedProcess) -> None:
+        limits = self.limits
+        rc = proc.returncode
+        if limits.memory_mb and (
+            rc == _PANDOC_OOM_EXIT or "Heap exhausted" in proc.stderr or "out of memory" in proc.stderr
+        ):
+            raise ResourceLimitExceeded("memory", f"Pandoc exceeded the {limits.memory_mb} MB memory limit")
+        if rc >= 0 or os.name != "posix":
+            return
+        # A SIGKILL may come from anywhere (the OOM killer, an operator), so
+        # only SIGXCPU is attributed to the CPU limit
+        if limits.cpu_sec and -rc == signal.SIGXCPU:
+            raise ResourceLimitExceeded("cpu", f"Pandoc exceeded the {limits.cpu_sec}s CPU time limit")
+        if limits.file_size_mb and -rc == signal.SIGXFSZ:
+            raise ResourceLimitExceeded("file_size", f"Pandoc exceeded the {limits.file_size_mb} MB file size limit")
@@ -1,8 +1,19 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
 import os
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.env import env_int
 
 
 def _build_db_url() -> str:
@@ -25,39 +36,186 @@ def _build_db_url() -> str:
 
 
 DB_URL = _build_db_url()
+# Optional read replica for GET endpoints; falls back to the primary
+DB_READ_URL = os.getenv("FEI2HTML_DB_READ_URL") or None
 
 
 class Base(DeclarativeBase):
     pass
 
 
-pool_size = None
-max_conn = os.getenv("DB_MAX_CONNECTIONS")
-try:
-    if max_conn:
-        pool_size = max(1, int(max_conn))
-except Exception:
-    pool_size = None
-
-engine_kwargs = {}
-if DB_URL.startswith("sqlite"):
-    engine_kwargs["connect_args"] = {"check_same_thread": False}
-else:
-    # Reasonable MySQL defaults
-    engine_kwargs.update({
-        "pool_pre_ping": True,
-        "pool_recycle": 1800,  # 30 minutes
-    })
-    if pool_size:
+@dataclass
+class PoolStats:
+    """Checkout counters for one engine's pool (wait times in seconds)."""
+
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        new = super().recreate()
+        new.stats = self.stats
+        return new
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            conn = super().connect()
+        except sa_exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return conn
+
+
+def _sqlite_in_memory(url: URL) -> bool:
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def _engine_kwargs(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and _sqlite_in_memory(parsed):
+        # Every new connection would open its own empty database: share one
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    engine_kwargs = {
+        "poolclass": MeteredQueuePool,
+        "pool_size": max(1, env_int("DB_MAX_CONNECTIONS", 5)),
+        "max_overflow": max(0, env_int("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": env_int("DB_POOL_TIMEOUT", 30),
+    }
+    if url.startswith("sqlite"):
+        engine_kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        # Reasonable MySQL defaults
         engine_kwargs.update({
-            "pool_size": min(pool_size, 50),
-            "max_overflow": 10,
+            "pool_pre_ping": True,
+            "pool_recycle": env_int("DB_POOL_RECYCLE", 1800),  # 30 minutes
+        })
+    return engine_kwargs
+
+
+def _configure_sqlite(engine: Engine) -> None:
+    """Enable WAL and a busy timeout so readers don't block on the writer."""
+
+    journal_mode = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    busy_timeout_ms = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+    in_memory = _sqlite_in_memory(engine.url)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            cur.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            if journal_mode and not in_memory:
+                cur.execute(f"PRAGMA journal_mode={journal_mode}")
+                if journal_mode.upper() == "WAL":
+                    cur.execute("PRAGMA synchronous=NORMAL")
+        finally:
+            cur.close()
+
+
+def _create_engine(url: str) -> Engine:
+    engine = create_engine(url, **_engine_kwargs(url))
+    if url.startswith("sqlite"):
+        _configure_sqlite(engine)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """Create the engine on first use.
+
+    Building it lazily keeps the DBAPI driver (e.g. PyMySQL) out of the import
+    path; no connection is opened until a session actually runs a statement.
+    """
+
+    return _create_engine(DB_URL)
+
+
+@lru_cache(maxsize=None)
+def get_read_engine() -> Engine:
+    """Engine for read-only endpoints: the replica if configured, else primary."""
+
+    if DB_READ_URL and DB_READ_URL != DB_URL:
+        return _create_engine(DB_READ_URL)
+    return get_engine()
+
+
+@lru_cache(maxsize=None)
+def _session_factory() -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+@lru_cache(maxsize=None)
+def _read_session_factory() -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_read_engine())
+
+
+def SessionLocal() -> Session:
+    return _session_factory()()
+
+
+def ReadSessionLocal() -> Session:
+    return _read_session_factory()()
+
+
+def __getattr__(name: str):
+    # Backwards compatible `from app.db import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _pool_metrics(engine: Engine) -> Dict[str, object]:
+    pool = engine.pool
+    data: Dict[str, object] = {"url": engine.url.render_as_string(hide_password=True)}
+    if isinstance(pool, QueuePool):
+        data.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checked_in": pool.checkedin(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        data.update({
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "wait_avg_ms": round(stats.wait_total / stats.checkouts * 1000, 3) if stats.checkouts else 0.0,
+            "wait_max_ms": round(stats.wait_max * 1000, 3),
         })
+    return data
+
+
+def pool_metrics() -> Dict[str, Dict[str, object]]:
+    """Snapshot of pool usage for the primary and (if separate) read engine."""
 
-engine = create_engine(DB_URL, **engine_kwargs)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    metrics = {"primary": _pool_metrics(get_engine())}
+    read_engine = get_read_engine()
+    if read_engine is not get_engine():
+        metrics["replica"] = _pool_metrics(read_engine)
+    return metrics
 
 
 def init_db():
     from app import models  # noqa: F401 ensure models are imported
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """Integer environment variable; unset, empty or invalid values give `default`."""
+
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        return int(raw.strip())
+    except ValueError:
+        return default
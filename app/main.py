@@ -1,29 +1,64 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from contextlib import contextmanager
+from typing import Iterator, Optional
 from pathlib import Path
+from urllib.parse import quote
+import asyncio
 import tempfile
 import shutil
 import hashlib
+import threading
 
-from app.db import SessionLocal, init_db
-from app.models import Document
-from app.schemas import ConvertResponse, DocumentCreateResponse, DocumentItem, DocumentDetail, AssetItem
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+from app.db import SessionLocal, ReadSessionLocal, init_db, pool_metrics
+from app.models import Asset, Document, DocumentTable
+from app.schemas import (
+    AssetManifest,
+    AssetStats,
+    AssetUsage,
+    ConvertResponse,
+    DocumentCreateResponse,
+    DocumentItem,
+    DocumentDetail,
+    AssetItem,
+    InspectPlan,
+    InspectResponse,
+    TableData,
+    TableRowsResponse,
+)
 from app.converters.hybrid import HybridConverter, ConversionError
+from app.converters.pandoc_converter import ResourceLimitExceeded
+from app.services.admission import AdmissionError, DocxCost, admission_metrics, estimate_cost, get_admission
+from app.services.export import EXPORT_FORMATS, ExportSource, export_filename, export_media_type, inline_threshold_kb, stream_export
 from app.services.image_store import LocalImageStore
 from app.services.sanitizer import sanitize_and_inject_css
 from app.services.preview import generate_preview_html
-from app.services.artifacts import write_asset_manifest
+from app.services.tables import virtualize_large_tables
 
 
 app = FastAPI(title="Fei2HTML Hybrid Converter")
 
+ASSETS_ROOT = Path("public/assets")
+# Same filesystem as ASSETS_ROOT (renames), but not served
+ASSETS_STAGING = Path("public/.staging")
+# Without fcntl, publishing is serialized within this process only
+_PUBLISH_LOCK = threading.Lock()
+
 
-def get_db():
-    db = SessionLocal()
+def get_read_db():
+    # Read-only endpoints; routed to the replica when FEI2HTML_DB_READ_URL is set
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -47,14 +82,62 @@ async def convert(file: UploadFile = File(...), doc_id: Optional[str] = Form(Non
 
         image_store = LocalImageStore(base_dir=Path("public/assets"), base_url="/assets")
         converter = HybridConverter(image_store=image_store)
+        result = await _run_conversion(converter, tmp_path, doc_id)
+
+        html_clean = await run_in_threadpool(sanitize_and_inject_css, result.html)
+        html_clean, tables = await run_in_threadpool(virtualize_large_tables, html_clean)
+        return ConvertResponse(
+            html=html_clean,
+            assets=[AssetItem(**a) for a in result.assets],
+            engine=result.engine,
+            tables=[TableData(**t) for t in tables],
+        )
+
+
+@app.post("/inspect", response_model=InspectResponse)
+async def inspect_docx(file: UploadFile = File(...)):
+    """What a conversion of this file would involve; nothing is converted or stored."""
 
+    if not file.filename or not file.filename.lower().endswith(".docx"):
+        raise HTTPException(status_code=400, detail="Only .docx files are supported")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp_path = Path(tmpdir) / file.filename
+        with tmp_path.open("wb") as f:
+            shutil.copyfileobj(file.file, f)
+        converter = HybridConverter(image_store=LocalImageStore(base_dir=Path("public/assets"), base_url="/assets"))
+        admission = get_admission()
         try:
-            result = converter.convert_docx(tmp_path, doc_id=doc_id)
-        except ConversionError as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            cost = await run_in_threadpool(estimate_cost, tmp_path)
+            # Same limits as a conversion before document.xml is parsed
+            lane = admission.check(cost)
+            plan = await run_in_threadpool(converter.plan, tmp_path, admission.capacity(lane))
+        except AdmissionError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
 
-        html_clean = sanitize_and_inject_css(result.html)
-        return ConvertResponse(html=html_clean, assets=[AssetItem(**a) for a in result.assets], engine=result.engine)
+    insp = plan.inspection
+    return InspectResponse(
+        file_bytes=insp.cost.compressed_bytes,
+        uncompressed_bytes=insp.cost.uncompressed_bytes,
+        document_xml_bytes=insp.document_xml_bytes,
+        media_count=insp.cost.media_count,
+        media_bytes=insp.cost.media_bytes,
+        pages=insp.pages,
+        pages_source=insp.pages_source,
+        paragraphs=insp.paragraphs,
+        headings=insp.headings,
+        tables=insp.tables,
+        table_rows=insp.table_rows,
+        images=insp.images,
+        equations=insp.equations,
+        sections=insp.sections,
+        page_breaks=insp.page_breaks,
+        characters=insp.characters,
+        feishu_markers=insp.feishu_markers,
+        is_feishu=insp.is_feishu,
+        elapsed_ms=insp.elapsed_ms,
+        plan=InspectPlan(pipeline=plan.pipeline, parts=plan.parts, workers=plan.workers, lane=lane, memory_mb=plan.memory_mb),
+    )
 
 
 @app.post("/documents/upload", response_model=DocumentCreateResponse)
@@ -64,8 +147,9 @@ async def upload_and_save(
     title: Optional[str] = Form(None),
     css_version: Optional[str] = Form("v1"),
     overwrite: Optional[bool] = Form(True),
-    db: Session = Depends(get_db),
 ):
+    # The DB is only touched in short transactions after the conversion, so
+    # no pooled connection is held while Pandoc runs.
     if not file.filename or not file.filename.lower().endswith(".docx"):
         raise HTTPException(status_code=400, detail="Only .docx files are supported")
 
@@ -76,61 +160,204 @@ async def upload_and_save(
             f.write(data)
         # Compute source hash
         source_hash = hashlib.sha256(data).hexdigest()
+        # Reject oversized documents before touching existing assets
+        cost = _admit_cost(tmp_path)
 
-        image_store = LocalImageStore(base_dir=Path("public/assets"), base_url="/assets")
+        # Images are converted into a staging directory next to (not inside)
+        # the served public/assets, and only replace the live /assets/{doc_id}
+        # together with the row, so a rejected or failed conversion leaves
+        # the current document intact.
+        ASSETS_STAGING.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=ASSETS_STAGING))
+        try:
+            image_store = LocalImageStore(base_dir=staging, base_url="/assets")
 
-        # Overwrite handling: if same doc_id exists, clear its asset directory and update the row
-        logical_id = doc_id or Path(file.filename).stem
-        if overwrite and logical_id:
-            existing = db.query(Document).filter(Document.doc_id == logical_id).first()
-            if existing:
-                # Clear assets directory for this doc
-                assets_dir = Path("public/assets") / logical_id
-                try:
-                    if assets_dir.exists():
-                        import shutil as _shutil
-                        _shutil.rmtree(assets_dir)
-                except Exception:
-                    pass
+            logical_id = doc_id or Path(file.filename).stem
 
-        converter = HybridConverter(image_store=image_store)
+            converter = HybridConverter(image_store=image_store)
+            result = await _run_conversion(converter, tmp_path, doc_id, cost)
+
+            html_clean = await run_in_threadpool(sanitize_and_inject_css, result.html)
+            html_clean, tables = await run_in_threadpool(virtualize_large_tables, html_clean)
+
+            try:
+                payload = await run_in_threadpool(
+                    _publish_document,
+                    staging,
+                    bool(overwrite),
+                    logical_id,
+                    title=title,
+                    source_hash=source_hash,
+                    engine=result.engine,
+                    css_version=css_version,
+                    html_content=html_clean,
+                    asset_manifest=None,
+                    tables=tables,
+                    assets=result.assets,
+                )
+            except AssetPublishError as e:
+                raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        preview_info = await run_in_threadpool(
+            generate_preview_html, logical_id, title or logical_id, html_clean, tables=tables
+        )
+        payload.update({
+            "preview_path": preview_info.path if preview_info else None,
+            "preview_url": preview_info.url if preview_info else None,
+            "asset_manifest_url": f"/documents/{payload['id']}/manifest",
+        })
+        return DocumentCreateResponse.model_validate(payload)
 
+
+def _admit_cost(path: Path) -> DocxCost:
+    """Cost estimate for an upload; HTTP 400/413 if it can't be admitted."""
+
+    try:
+        return get_admission().admit(path)
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+def _convert_admitted(converter: HybridConverter, path: Path, doc_id: Optional[str], cost: DocxCost):
+    # Runs on the admission executor; blocks there while waiting for a slot.
+    # A split conversion holds one slot per Pandoc worker.
+    admission = get_admission()
+    # Inspecting parses all of document.xml: only for documents within limits
+    lane = admission.check(cost)
+    plan = converter.plan(path, max_workers=admission.capacity(lane))
+    with admission.slot(cost, slots=plan.workers, memory_mb=plan.memory_mb):
+        return converter.convert_docx(path, doc_id=doc_id, plan=plan)
+
+
+async def _run_conversion(converter: HybridConverter, path: Path, doc_id: Optional[str], cost: Optional[DocxCost] = None):
+    cost = cost or _admit_cost(path)
+    admission = get_admission()
+    try:
+        # Not run_in_threadpool: queued jobs would hold AnyIO's shared threads
+        return await asyncio.get_running_loop().run_in_executor(
+            admission.executor(), _convert_admitted, converter, path, doc_id, cost
+        )
+    except AdmissionError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+    except ResourceLimitExceeded as e:
+        get_admission().record_limit(e.limit)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ConversionError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class AssetPublishError(Exception):
+    pass
+
+
+def _publish_document(staging: Path, overwrite: bool, logical_id: str, **save_kwargs) -> dict:
+    """Swap the staged `{logical_id}/` images in and save the row, as one step.
+
+    Serialized per doc_id (across worker processes too); if the swap fails
+    the row isn't written, and if the save fails the previous images are
+    moved back. Overwriting an existing document replaces its directory as
+    a whole; otherwise the new files are added to a copy of it.
+    """
+
+    staged = staging / logical_id
+    live = ASSETS_ROOT / logical_id
+    previous = staging / ".previous"
+    with _publish_lock(logical_id):
+        # Overwrite handling: if same doc_id exists, replace its asset directory and update the row
+        replace = overwrite and _document_exists(logical_id)
+        if not replace and live.exists():
+            # New files win on name clashes, as when writing in place
+            merged = staging / ".merged"
+            shutil.copytree(live, merged)
+            if staged.exists():
+                shutil.copytree(staged, merged, dirs_exist_ok=True)
+            staged = merged
+        moved_old = moved_new = False
         try:
-            result = converter.convert_docx(tmp_path, doc_id=doc_id)
-        except ConversionError as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            if live.exists():
+                live.rename(previous)
+                moved_old = True
+            if staged.exists():
+                live.parent.mkdir(parents=True, exist_ok=True)
+                staged.rename(live)
+                moved_new = True
+            return _save_document(logical_id, **save_kwargs)
+        except Exception as e:
+            # Put the previous images back; the staging directory (with the
+            # new ones) is removed by the caller
+            if moved_new:
+                live.rename(staging / ".failed")
+            if moved_old:
+                previous.rename(live)
+            if isinstance(e, OSError):
+                raise AssetPublishError(f"Could not publish the assets of {logical_id}: {e}") from e
+            raise
+
 
-        html_clean = sanitize_and_inject_css(result.html)
-        preview_info = generate_preview_html(logical_id, title or logical_id, html_clean)
-        manifest_path = write_asset_manifest(logical_id, result.engine, result.assets)
+@contextmanager
+def _publish_lock(logical_id: str) -> Iterator[None]:
+    if fcntl is None:
+        with _PUBLISH_LOCK:
+            yield
+        return
+    locks = ASSETS_STAGING / "locks"
+    locks.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha256(logical_id.encode("utf-8")).hexdigest()[:32]
+    with (locks / f"{name}.lock").open("a") as f:
+        # Released when the file is closed
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
 
+
+def _document_exists(logical_id: str) -> bool:
+    # Primary, not the replica: this decides whether to overwrite
+    with SessionLocal() as db:
+        return db.query(Document.id).filter(Document.doc_id == logical_id).first() is not None
+
+
+def _save_document(logical_id: Optional[str], tables: list, assets: list, **fields) -> dict:
+    """Upsert by doc_id in one short transaction and return the row as a dict."""
+
+    try:
+        return _upsert_document(logical_id, tables, assets, **fields)
+    except IntegrityError:
+        if not logical_id:
+            raise
+        # Another process inserted the same doc_id first: update that row
+        return _upsert_document(logical_id, tables, assets, **fields)
+
+
+def _upsert_document(logical_id: Optional[str], tables: list, assets: list, **fields) -> dict:
+    with SessionLocal() as db, db.begin():
         # Upsert by doc_id if provided or derived
         doc = db.query(Document).filter(Document.doc_id == logical_id).first() if logical_id else None
         if doc:
-            doc.title = title
-            doc.source_hash = source_hash
-            doc.engine = result.engine
-            doc.css_version = css_version
-            doc.html_content = html_clean
-            doc.asset_manifest = result.assets
-            db.add(doc)
-            db.commit()
-            db.refresh(doc)
+            for key, value in fields.items():
+                setattr(doc, key, value)
         else:
-            doc = Document(
-                doc_id=logical_id,
-                title=title,
-                source_hash=source_hash,
-                engine=result.engine,
-                css_version=css_version,
-                html_content=html_clean,
-                asset_manifest=result.assets,
-            )
+            doc = Document(doc_id=logical_id, **fields)
             db.add(doc)
-            db.commit()
-            db.refresh(doc)
-
-        return DocumentCreateResponse.model_validate({
+        db.flush()
+        # Replace virtualized table rows wholesale
+        db.query(DocumentTable).filter(DocumentTable.document_id == doc.id).delete(synchronize_session=False)
+        if tables:
+            db.add_all([
+                DocumentTable(
+                    document_id=doc.id,
+                    table_index=t["index"],
+                    total_rows=t["total_rows"],
+                    inline_rows=t["inline_rows"],
+                    rows=t["rows"],
+                )
+                for t in tables
+            ])
+        # Asset manifest rows: one bulk INSERT per conversion
+        db.query(Asset).filter(Asset.document_id == doc.id).delete(synchronize_session=False)
+        if assets:
+            db.execute(insert(Asset), [_asset_row(doc.id, doc.doc_id, a) for a in assets])
+        return {
             "id": doc.id,
             "doc_id": doc.doc_id,
             "title": doc.title,
@@ -138,35 +365,62 @@ async def upload_and_save(
             "source_hash": doc.source_hash,
             "css_version": doc.css_version,
             "html_content": doc.html_content,
-            "asset_manifest": doc.asset_manifest or [],
-            "preview_path": preview_info.path if preview_info else None,
-            "preview_url": preview_info.url if preview_info else None,
-            "asset_manifest_path": manifest_path,
-        })
+            "asset_manifest": assets,
+        }
+
+
+def _asset_row(document_id: int, doc_id: Optional[str], asset: dict) -> dict:
+    return {
+        "document_id": document_id,
+        "doc_id": doc_id,
+        "digest": asset.get("digest"),
+        "name": asset["name"],
+        "url": asset["url"],
+        "size": asset.get("size"),
+        "width": asset.get("width"),
+        "height": asset.get("height"),
+        "mime": asset.get("mime"),
+    }
+
+
+def _load_assets(db: Session, doc: Document) -> list:
+    """Manifest entries from the assets table (legacy rows: the JSON column)."""
+
+    rows = db.query(Asset).filter(Asset.document_id == doc.id).order_by(Asset.id).all()
+    if not rows:
+        return doc.asset_manifest or []
+    return [
+        {
+            "name": a.name,
+            "url": a.url,
+            "digest": a.digest,
+            "size": a.size,
+            "width": a.width,
+            "height": a.height,
+            "mime": a.mime,
+        }
+        for a in rows
+    ]
 
 
 @app.get("/documents", response_model=list[DocumentItem])
-def list_documents(db: Session = Depends(get_db)):
+def list_documents(db: Session = Depends(get_read_db)):
     items = db.query(Document.id, Document.doc_id, Document.title, Document.engine, Document.source_hash).order_by(Document.id.desc()).all()
     return [DocumentItem(id=i[0], doc_id=i[1], title=i[2], engine=i[3], source_hash=i[4]) for i in items]
 
 
 @app.get("/documents/{doc_id}", response_model=DocumentDetail)
-def get_document(doc_id: int, db: Session = Depends(get_db)):
+def get_document(doc_id: int, db: Session = Depends(get_read_db)):
     doc = db.query(Document).filter(Document.id == doc_id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     preview_file = None
     preview_url = None
-    asset_manifest_path = None
     if doc.doc_id:
         preview_candidate = Path("out") / f"{doc.doc_id}_preview.html"
         if preview_candidate.exists():
             preview_file = str(preview_candidate)
             preview_url = f"/out/{doc.doc_id}_preview.html"
-        manifest_candidate = Path("out") / f"{doc.doc_id}.assets.json"
-        if manifest_candidate.exists():
-            asset_manifest_path = str(manifest_candidate)
     return DocumentDetail.model_validate({
         "id": doc.id,
         "doc_id": doc.doc_id,
@@ -174,8 +428,131 @@ def get_document(doc_id: int, db: Session = Depends(get_db)):
         "engine": doc.engine,
         "source_hash": doc.source_hash,
         "html_content": doc.html_content,
-        "asset_manifest": doc.asset_manifest or [],
+        "asset_manifest": _load_assets(db, doc),
         "preview_path": preview_file,
         "preview_url": preview_url,
-        "asset_manifest_path": asset_manifest_path,
+        "asset_manifest_url": f"/documents/{doc.id}/manifest",
     })
+
+
+@app.get("/documents/{doc_id}/manifest", response_model=AssetManifest)
+def get_document_manifest(doc_id: int, db: Session = Depends(get_read_db)):
+    """Asset manifest (same shape as the former out/{doc_id}.assets.json)."""
+
+    doc = db.query(Document).filter(Document.id == doc_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return AssetManifest(engine=doc.engine, assets=[AssetItem(**a) for a in _load_assets(db, doc)])
+
+
+@app.get("/asset-usage/{digest}", response_model=list[AssetUsage])
+def asset_usage(digest: str, db: Session = Depends(get_read_db)):
+    """Documents that use an image, by content digest (sha256)."""
+
+    rows = (
+        db.query(Asset.document_id, Asset.doc_id, Asset.name, Asset.url)
+        .filter(Asset.digest == digest)
+        .order_by(Asset.document_id)
+        .all()
+    )
+    return [AssetUsage(id=r[0], doc_id=r[1], name=r[2], url=r[3]) for r in rows]
+
+
+@app.get("/asset-stats", response_model=list[AssetStats])
+def asset_stats(db: Session = Depends(get_read_db)):
+    """Asset count and total bytes per document."""
+
+    rows = (
+        db.query(Asset.document_id, Asset.doc_id, func.count(Asset.id), func.coalesce(func.sum(Asset.size), 0))
+        .group_by(Asset.document_id, Asset.doc_id)
+        .order_by(Asset.document_id)
+        .all()
+    )
+    return [AssetStats(id=r[0], doc_id=r[1], count=r[2], total_bytes=r[3]) for r in rows]
+
+
+@app.get("/documents/{doc_id}/tables/{index}", response_model=TableRowsResponse)
+def get_document_table(doc_id: int, index: int, offset: int = 0, limit: int = 500, db: Session = Depends(get_read_db)):
+    """Rows of a virtualized table beyond the inline ones.
+
+    `offset` counts from the first non-inline row.
+    """
+
+    table = (
+        db.query(DocumentTable)
+        .filter(DocumentTable.document_id == doc_id, DocumentTable.table_index == index)
+        .first()
+    )
+    if not table:
+        raise HTTPException(status_code=404, detail="Table not found")
+    offset = max(0, offset)
+    limit = max(1, min(limit, 5000))
+    return TableRowsResponse(
+        index=table.table_index,
+        total_rows=table.total_rows,
+        inline_rows=table.inline_rows,
+        offset=offset,
+        rows=table.rows[offset:offset + limit],
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+@app.get("/documents/{doc_id}/export")
+def export_document(
+    doc_id: int,
+    format: str = "zip",
+    inline_max_kb: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    """Portable copy of a document, streamed: a ZIP with its assets, or one
+    HTML file with small images inlined (`inline_max_kb`). 304 when the
+    client's copy (`If-None-Match`) is current."""
+
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    doc = db.query(Document).filter(Document.id == doc_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    tables = (
+        db.query(DocumentTable)
+        .filter(DocumentTable.document_id == doc.id)
+        .order_by(DocumentTable.table_index)
+        .all()
+    )
+    src = ExportSource(
+        doc_id=doc.doc_id or str(doc.id),
+        title=doc.title or doc.doc_id or "",
+        html=doc.html_content or "",
+        tables=[
+            {"index": t.table_index, "total_rows": t.total_rows, "inline_rows": t.inline_rows, "rows": t.rows}
+            for t in tables
+        ],
+        assets=_load_assets(db, doc),
+        source_hash=doc.source_hash,
+        css_version=doc.css_version,
+    )
+    name = export_filename(src, format)
+    headers = {
+        # ASCII fallback for old clients, the real name per RFC 5987
+        "Content-Disposition": f"attachment; filename=\"{name.encode('ascii', 'replace').decode()}\"; filename*=UTF-8''{quote(name)}",
+    }
+    inline_max_kb = inline_threshold_kb(inline_max_kb)
+    key = src.cache_key(format, inline_max_kb)
+    if key:
+        headers["ETag"] = f'"{key}"'
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers={"ETag": headers["ETag"]})
+    return StreamingResponse(stream_export(src, format, inline_max_kb), media_type=export_media_type(format), headers=headers)
+
+
+@app.get("/metrics")
+def metrics():
+    return {"db": pool_metrics(), "conversion": admission_metrics()}
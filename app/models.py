@@ -1,24 +1,27 @@
 from __future__ import annotations
 
-from sqlalchemy import Column, Integer, String, Text
-from sqlalchemy.dialects.sqlite import JSON as SQLITE_JSON
-from sqlalchemy.dialects.postgresql import JSONB as PG_JSONB
-from sqlalchemy.dialects.mysql import JSON as MYSQL_JSON
-from sqlalchemy import inspect
+from sqlalchemy import BigInteger, Column, ForeignKey, Index, Integer, String, Text, JSON, UniqueConstraint
+from sqlalchemy.types import TypeDecorator
 
-from app.db import Base, engine
+from app.db import Base
 
 
-def _json_type():
-    # Use native JSON if available, otherwise fallback to Text containing JSON string
-    dialect = inspect(engine).dialect.name
-    if dialect == "postgresql":
-        return PG_JSONB
-    if dialect == "sqlite":
-        return SQLITE_JSON
-    if dialect == "mysql":
-        return MYSQL_JSON
-    return Text
+class _JSONType(TypeDecorator):
+    """Native JSON column, resolved per dialect at first use.
+
+    Picking the type when the dialect is known avoids importing every
+    dialect package and inspecting the engine (a DB connection) at import.
+    """
+
+    impl = JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import JSONB
+
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(JSON())
 
 
 class Document(Base):
@@ -31,4 +34,38 @@ class Document(Base):
     engine = Column(String(64), nullable=False)
     css_version = Column(String(32), nullable=True)
     html_content = Column(Text, nullable=False)
-    asset_manifest = Column(_json_type(), nullable=True)
+    # Legacy copy of the manifest; new uploads keep it in `assets`
+    asset_manifest = Column(_JSONType(), nullable=True)
+
+
+class DocumentTable(Base):
+    """Row data for a virtualized (large) table; only the rows past
+    `inline_rows` are stored, the first ones live in `html_content`."""
+
+    __tablename__ = "document_tables"
+    __table_args__ = (UniqueConstraint("document_id", "table_index"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    table_index = Column(Integer, nullable=False)
+    total_rows = Column(Integer, nullable=False)
+    inline_rows = Column(Integer, nullable=False)
+    rows = Column(_JSONType(), nullable=False)
+
+
+class Asset(Base):
+    """One uploaded media file of a document (the normalized asset manifest)."""
+
+    __tablename__ = "assets"
+    __table_args__ = (Index("ix_assets_document_id_size", "document_id", "size"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    doc_id = Column(String(255), index=True, nullable=True)
+    digest = Column(String(64), index=True, nullable=True)
+    name = Column(String(512), nullable=False)
+    url = Column(String(1024), nullable=False)
+    size = Column(BigInteger, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    mime = Column(String(128), nullable=True)
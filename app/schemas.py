@@ -7,12 +7,56 @@ from typing import List, Optional, Any
 class AssetItem(BaseModel):
     name: str
     url: str
+    digest: Optional[str] = None
+    size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mime: Optional[str] = None
+
+
+class TableData(BaseModel):
+    index: int
+    total_rows: int
+    inline_rows: int
+    rows: List[List[Any]]
 
 
 class ConvertResponse(BaseModel):
     html: str
     assets: List[AssetItem]
     engine: str
+    tables: List[TableData] = Field(default_factory=list)
+
+
+class InspectPlan(BaseModel):
+    pipeline: str
+    parts: int
+    workers: int
+    lane: str
+    memory_mb: int
+
+
+class InspectResponse(BaseModel):
+    file_bytes: int
+    uncompressed_bytes: int
+    document_xml_bytes: int
+    media_count: int
+    media_bytes: int
+    pages: int
+    pages_source: str
+    paragraphs: int
+    headings: int
+    tables: int
+    table_rows: int
+    images: int
+    equations: int
+    sections: int
+    page_breaks: int
+    characters: int
+    feishu_markers: List[str] = Field(default_factory=list)
+    is_feishu: bool = False
+    elapsed_ms: float
+    plan: InspectPlan
 
 
 class DocumentCreateResponse(BaseModel):
@@ -26,7 +70,7 @@ class DocumentCreateResponse(BaseModel):
     assets: List[AssetItem] = Field(default_factory=list, alias="asset_manifest")
     preview_path: Optional[str] = None
     preview_url: Optional[str] = None
-    asset_manifest_path: Optional[str] = None
+    asset_manifest_url: Optional[str] = None
 
 
 class DocumentItem(BaseModel):
@@ -42,4 +86,31 @@ class DocumentDetail(DocumentItem):
     assets: List[AssetItem] = Field(default_factory=list, alias="asset_manifest")
     preview_path: Optional[str] = None
     preview_url: Optional[str] = None
-    asset_manifest_path: Optional[str] = None
+    asset_manifest_url: Optional[str] = None
+
+
+class AssetManifest(BaseModel):
+    engine: str
+    assets: List[AssetItem]
+
+
+class AssetUsage(BaseModel):
+    id: int
+    doc_id: Optional[str] = None
+    name: str
+    url: str
+
+
+class AssetStats(BaseModel):
+    id: int
+    doc_id: Optional[str] = None
+    count: int
+    total_bytes: int
+
+
+class TableRowsResponse(BaseModel):
+    index: int
+    total_rows: int
+    inline_rows: int
+    offset: int
+    rows: List[List[Any]]
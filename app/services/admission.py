@@ -0,0 +1,322 @@
+"""Admission control for conversions.
+
+Each upload is costed from its zip central directory (no decompression)
+before Pandoc runs. Documents that would exceed the per-conversion limits
+are rejected outright; the rest wait for a slot in one of two lanes:
+
+- "small": cheap documents; `small_reserved` slots and the matching memory
+  are kept free for them, and they are admitted before any waiting large
+  document, so a burst of huge uploads can't starve them;
+- "large": everything else, limited to the remaining slots and memory.
+
+Jobs that can't get a slot (queue full, or still waiting after
+`queue_timeout` seconds) are throttled. All outcomes are counted for
+`GET /metrics`.
+
+Waiting happens on the controller's own executor, sized for every job that
+can be running or queued, so queued conversions never occupy the threads
+the web framework uses for everything else.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+from app.env import env_int
+
+
+_MIB = 1 << 20
+# Pandoc 3 peak RSS, measured: ~160 MB baseline plus ~80x the size of the
+# XML parts; media files are held in memory as well
+PANDOC_BASE_MB = 160
+PANDOC_XML_FACTOR = 80
+# Only entries bigger than this count towards the compression ratio check
+_RATIO_MIN_BYTES = _MIB
+_MAX_ENTRIES = 20000
+
+
+class AdmissionError(Exception):
+    """A conversion was not admitted; `reason` is the metrics key."""
+
+    status_code = 503
+
+    def __init__(self, reason: str, message: str, status_code: Optional[int] = None, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.reason = reason
+        if status_code is not None:
+            self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ConversionRejected(AdmissionError):
+    status_code = 413
+
+
+class ConversionThrottled(AdmissionError):
+    status_code = 503
+
+
+@dataclass
+class DocxCost:
+    compressed_bytes: int
+    uncompressed_bytes: int
+    xml_bytes: int
+    media_count: int
+    media_bytes: int
+    entries: int
+    # Largest uncompressed/compressed ratio among entries over 1 MiB
+    max_ratio: float
+
+    @property
+    def memory_mb(self) -> int:
+        """Estimated peak Pandoc memory."""
+
+        return int(PANDOC_BASE_MB + (PANDOC_XML_FACTOR * self.xml_bytes + self.media_bytes) / _MIB)
+
+
+def estimate_cost(docx_path: Union[str, Path]) -> DocxCost:
+    """Read the zip central directory; nothing is decompressed."""
+
+    try:
+        with zipfile.ZipFile(docx_path) as zf:
+            infos = zf.infolist()
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ConversionRejected("invalid_docx", f"Not a valid .docx file: {e}", status_code=400) from e
+    if not any(i.filename == "word/document.xml" for i in infos):
+        raise ConversionRejected("invalid_docx", "Not a valid .docx file: word/document.xml is missing", status_code=400)
+
+    cost = DocxCost(0, 0, 0, 0, 0, len(infos), 0.0)
+    for info in infos:
+        cost.compressed_bytes += info.compress_size
+        cost.uncompressed_bytes += info.file_size
+        name = info.filename
+        if name.endswith((".xml", ".rels")):
+            cost.xml_bytes += info.file_size
+        elif name.startswith("word/media/") and not info.is_dir():
+            cost.media_count += 1
+            cost.media_bytes += info.file_size
+        if info.file_size > _RATIO_MIN_BYTES:
+            cost.max_ratio = max(cost.max_ratio, info.file_size / max(info.compress_size, 1))
+    return cost
+
+
+class AdmissionController:
+    """Two-lane slot and memory accounting; thread-safe, waits block the caller."""
+
+    def __init__(
+        self,
+        slots: int = 4,
+        small_reserved: int = 1,
+        memory_budget_mb: int = 4096,
+        small_memory_mb: int = 320,
+        max_job_memory_mb: int = 2048,
+        max_uncompressed_mb: int = 512,
+        max_media: int = 2000,
+        max_ratio: int = 200,
+        max_queue: int = 16,
+        queue_timeout: float = 30.0,
+    ):
+        self.slots = max(1, slots)
+        self.small_reserved = min(max(0, small_reserved), self.slots - 1)
+        self.memory_budget_mb = memory_budget_mb
+        self.small_memory_mb = small_memory_mb
+        self.max_job_memory_mb = max_job_memory_mb
+        self.max_uncompressed_mb = max_uncompressed_mb
+        self.max_media = max_media
+        self.max_ratio = max_ratio
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        # Slots in use per lane
+        self._running: Dict[str, int] = {"small": 0, "large": 0}
+        self._queued: Dict[str, int] = {"small": 0, "large": 0}
+        self._reserved_mb = 0
+        self._admitted: Dict[str, int] = {"small": 0, "large": 0}
+        self._wait_total: Dict[str, float] = {"small": 0.0, "large": 0.0}
+        self._wait_max: Dict[str, float] = {"small": 0.0, "large": 0.0}
+        self._rejected: Dict[str, int] = {}
+        self._throttled: Dict[str, int] = {}
+        self._limit_exceeded: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            slots=env_int("CONVERT_SLOTS", max(2, os.cpu_count() or 2)),
+            small_reserved=env_int("CONVERT_SMALL_RESERVED", 1),
+            memory_budget_mb=env_int("CONVERT_MEMORY_BUDGET_MB", 4096),
+            small_memory_mb=env_int("CONVERT_SMALL_MEMORY_MB", 320),
+            # Same variable as the Pandoc heap limit
+            max_job_memory_mb=env_int("CONVERT_MAX_MEMORY_MB", 2048),
+            max_uncompressed_mb=env_int("CONVERT_MAX_UNCOMPRESSED_MB", 512),
+            max_media=env_int("CONVERT_MAX_MEDIA", 2000),
+            max_ratio=env_int("CONVERT_MAX_RATIO", 200),
+            max_queue=env_int("CONVERT_MAX_QUEUE", 16),
+            queue_timeout=env_int("CONVERT_QUEUE_TIMEOUT", 30),
+        )
+
+    def lane(self, cost: DocxCost) -> str:
+        return "small" if cost.memory_mb <= self.small_memory_mb else "large"
+
+    def check(self, cost: DocxCost) -> str:
+        """Reject documents over the limits; return the lane otherwise."""
+
+        problem = None
+        if cost.uncompressed_bytes > self.max_uncompressed_mb * _MIB:
+            problem = ("too_large", f"{cost.uncompressed_bytes // _MIB} MB uncompressed (limit {self.max_uncompressed_mb} MB)")
+        elif cost.media_count > self.max_media:
+            problem = ("too_many_media", f"{cost.media_count} media files (limit {self.max_media})")
+        elif cost.entries > _MAX_ENTRIES:
+            problem = ("too_many_entries", f"{cost.entries} zip entries (limit {_MAX_ENTRIES})")
+        elif cost.max_ratio > self.max_ratio:
+            problem = ("compression_ratio", f"compression ratio {cost.max_ratio:.0f}:1 (limit {self.max_ratio}:1)")
+        elif self.max_job_memory_mb and cost.memory_mb > self.max_job_memory_mb:
+            problem = ("memory", f"estimated {cost.memory_mb} MB of memory (limit {self.max_job_memory_mb} MB)")
+        if problem:
+            self._count(self._rejected, problem[0])
+            raise ConversionRejected(problem[0], f"Document too large to convert: {problem[1]}")
+        return self.lane(cost)
+
+    def admit(self, docx_path: Union[str, Path]) -> DocxCost:
+        """`estimate_cost` + `check`, counting invalid files as rejections too."""
+
+        try:
+            cost = estimate_cost(docx_path)
+        except ConversionRejected as e:
+            self._count(self._rejected, e.reason)
+            raise
+        self.check(cost)
+        return cost
+
+    def capacity(self, lane: str) -> int:
+        """Most slots one job in `lane` can hold (split conversions take several)."""
+
+        return self.slots if lane == "small" else self.slots - self.small_reserved
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Threads for admitted jobs: one per slot plus a full queue per lane.
+
+        A job past `slot()`'s queue check always finds a free thread, so the
+        queue limits are enforced here rather than by a hidden executor queue.
+        """
+
+        with self._cond:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.slots + 2 * max(0, self.max_queue),
+                    thread_name_prefix="convert",
+                )
+            return self._executor
+
+    def _can_start(self, lane: str, need_mb: int, need_slots: int) -> bool:
+        running = self._running["small"] + self._running["large"]
+        if running + need_slots > self.slots:
+            return False
+        budget = self.memory_budget_mb
+        if lane == "large":
+            # Small documents first, and never take the reserved slots/memory
+            if self._queued["small"] or self._running["large"] + need_slots > self.capacity("large"):
+                return False
+            budget -= self.small_reserved * self.small_memory_mb
+        # A lone job always runs; its own size is capped by check()
+        return running == 0 or self._reserved_mb + need_mb <= budget
+
+    @contextmanager
+    def slot(self, cost: DocxCost, slots: int = 1, memory_mb: Optional[int] = None) -> Iterator[str]:
+        """Hold conversion slots for the duration of the block; yields the lane.
+
+        A conversion split into parts holds one slot per Pandoc worker and
+        its own memory estimate (`memory_mb`) instead of the whole document's.
+        """
+
+        lane = self.check(cost)
+        need_mb = cost.memory_mb if memory_mb is None else memory_mb
+        need_slots = max(1, min(slots, self.capacity(lane)))
+        started = time.monotonic()
+        with self._cond:
+            if self._queued[lane] >= self.max_queue:
+                self._count(self._throttled, "queue_full")
+                raise ConversionThrottled(
+                    "queue_full",
+                    f"Conversion queue is full ({self._queued[lane]} {lane} documents waiting); retry later",
+                    retry_after=max(1, int(self.queue_timeout)),
+                )
+            self._queued[lane] += 1
+            try:
+                while not self._can_start(lane, need_mb, need_slots):
+                    remaining = started + self.queue_timeout - time.monotonic()
+                    if remaining <= 0:
+                        self._count(self._throttled, "queue_timeout")
+                        raise ConversionThrottled(
+                            "queue_timeout",
+                            f"No conversion slot became free within {self.queue_timeout:g}s; retry later",
+                            retry_after=max(1, int(self.queue_timeout)),
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._queued[lane] -= 1
+                # Large jobs may be waiting on this lane to drain
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            self._running[lane] += need_slots
+            self._reserved_mb += need_mb
+            self._admitted[lane] += 1
+            self._wait_total[lane] += waited
+            self._wait_max[lane] = max(self._wait_max[lane], waited)
+        try:
+            yield lane
+        finally:
+            with self._cond:
+                self._running[lane] -= need_slots
+                self._reserved_mb -= need_mb
+                self._cond.notify_all()
+
+    def record_limit(self, limit: str) -> None:
+        """Count a conversion stopped by a Pandoc limit (memory/cpu/file_size)."""
+
+        self._count(self._limit_exceeded, limit)
+
+    def _count(self, counter: Dict[str, int], key: str) -> None:
+        # The condition's lock is an RLock, so this is fine while holding it
+        with self._cond:
+            counter[key] = counter.get(key, 0) + 1
+
+    def metrics(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "small_reserved": self.small_reserved,
+                "memory_budget_mb": self.memory_budget_mb,
+                "reserved_mb": self._reserved_mb,
+                "running": dict(self._running),
+                "queued": dict(self._queued),
+                "admitted": dict(self._admitted),
+                "wait_avg_ms": {
+                    lane: round(1000 * self._wait_total[lane] / n, 2) if n else 0.0
+                    for lane, n in self._admitted.items()
+                },
+                "wait_max_ms": {lane: round(1000 * w, 2) for lane, w in self._wait_max.items()},
+                "rejected": dict(self._rejected),
+                "throttled": dict(self._throttled),
+                "limit_exceeded": dict(self._limit_exceeded),
+            }
+
+
+@lru_cache(maxsize=None)
+def get_admission() -> AdmissionController:
+    """Process-wide controller, configured from the environment on first use."""
+
+    return AdmissionController.from_env()
+
+
+def admission_metrics() -> Dict[str, object]:
+    return get_admission().metrics()
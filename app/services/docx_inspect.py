@@ -0,0 +1,291 @@
+"""Cheap pre-conversion inspection of a .docx.
+
+Sizes come from the zip central directory (`estimate_cost`); word/document.xml
+is streamed through expat in chunks, so nothing is extracted to disk and
+memory stays flat however large the document is. Media files are never read.
+
+Besides the counts returned by `POST /inspect`, the inspection records the
+byte offsets of body-level headings, which `HybridConverter` uses to split
+large documents into independently convertible parts.
+"""
+from __future__ import annotations
+
+import re
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from xml.parsers import expat
+
+from app.services.admission import ConversionRejected, DocxCost, estimate_cost
+
+
+_W_NS = frozenset((
+    "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+    "http://purl.oclc.org/ooxml/wordprocessingml/main",
+))
+_M_NS = frozenset((
+    "http://schemas.openxmlformats.org/officeDocument/2006/math",
+    "http://purl.oclc.org/ooxml/officeDocument/math",
+))
+_CHUNK = 1 << 16
+# Rough A4 page: 45 lines of ~40 CJK (or ~80 Latin) characters
+_LINE_CHARS = 40
+_PAGE_LINES = 45
+_IMAGE_LINES = 12
+_HEADING_STYLE_RE = re.compile(r"^(?:heading|标题)\s*(\d)$", re.I)
+_HEADING_ID_RE = re.compile(r"^Heading(\d)$")
+_PAGES_RE = re.compile(rb"<(?:\w+:)?Pages>\s*(\d+)\s*</(?:\w+:)?Pages>")
+_APP_RE = re.compile(rb"<(?:\w+:)?Application>([^<]*)</(?:\w+:)?Application>")
+_STYLE_RE = re.compile(rb"<(?:\w+:)?style\b")
+_LIST_GLYPHS = "•●○◦·"
+
+
+@dataclass
+class DocxInspection:
+    cost: DocxCost
+    document_xml_bytes: int = 0
+    paragraphs: int = 0
+    tables: int = 0
+    table_rows: int = 0
+    images: int = 0
+    equations: int = 0
+    headings: int = 0
+    sections: int = 0
+    page_breaks: int = 0
+    characters: int = 0
+    pages: int = 0
+    # "app.xml" (as saved by Word), "rendered" (Word's rendered page
+    # breaks) or "estimate" (from text, images and table rows)
+    pages_source: str = "estimate"
+    feishu_markers: List[str] = field(default_factory=list)
+    # (byte offset in word/document.xml, heading level) of body-level headings
+    section_starts: List[Tuple[int, int]] = field(default_factory=list)
+    # Byte range of the body's block content, i.e. without the final sectPr
+    body_range: Tuple[int, int] = (0, 0)
+    # Bookmarks targeted by internal hyperlinks (TOC entries etc.), in order
+    link_anchors: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def is_feishu(self) -> bool:
+        # Generic POI output alone isn't enough
+        return len(self.feishu_markers) >= 2
+
+    def split_offsets(self, parts: int) -> List[int]:
+        """Up to `parts - 1` offsets at top-level headings, evenly spread by size."""
+
+        if parts < 2 or not self.section_starts:
+            return []
+        top = min(level for _, level in self.section_starts)
+        start, end = self.body_range
+        candidates = [off for off, level in self.section_starts if level == top and start < off < end]
+        offsets: List[int] = []
+        for i in range(1, parts):
+            target = start + (end - start) * i // parts
+            best = min(candidates, key=lambda off: abs(off - target), default=None)
+            if best is not None and best not in offsets:
+                offsets.append(best)
+        return sorted(offsets)
+
+
+class _Scanner:
+    """expat callbacks; state is per document, so one instance per `inspect()`."""
+
+    def __init__(self, parser, heading_styles: Dict[str, int], result: DocxInspection):
+        self.parser = parser
+        self.heading_styles = heading_styles
+        self.r = result
+        self.depth = 0
+        self.body_depth = 0
+        # Block-level paragraph being read: (start offset, heading level)
+        self.block: Optional[List[int]] = None
+        self.in_text = False
+        self.first_text = False
+        self.glyph_paragraphs = 0
+        self.heading_bookmarks = 0
+        self.numeric_styles = 0
+        self.lines = 0
+        self.para_chars = 0
+        self.anchors: Dict[str, None] = {}
+
+    def start(self, name: str, attrs: Dict[str, str]) -> None:
+        self.depth += 1
+        ns, _, local = name.rpartition(" ")
+        r = self.r
+        if ns in _W_NS:
+            if self.body_depth and self.depth == self.body_depth + 1 and not r.body_range[0]:
+                # Body content starts at its first block
+                r.body_range = (self.parser.CurrentByteIndex, 0)
+            if local == "p":
+                r.paragraphs += 1
+                self.para_chars = 0
+                self.first_text = True
+                if self.depth == self.body_depth + 1:
+                    self.block = [self.parser.CurrentByteIndex, 0]
+            elif local == "t":
+                self.in_text = True
+            elif local == "tbl":
+                r.tables += 1
+            elif local == "tr":
+                r.table_rows += 1
+            elif local in ("drawing", "pict"):
+                r.images += 1
+            elif local == "br":
+                if _attr(attrs, "type") == "page":
+                    r.page_breaks += 1
+            elif local == "lastRenderedPageBreak":
+                r.page_breaks += 1
+            elif local == "sectPr":
+                r.sections += 1
+                if self.depth == self.body_depth + 1:
+                    r.body_range = (r.body_range[0], self.parser.CurrentByteIndex)
+            elif local == "pStyle" and self._in_block_ppr():
+                style = _attr(attrs, "val") or ""
+                if style.isdigit():
+                    self.numeric_styles += 1
+                level = self.heading_styles.get(style)
+                if level and not self.block[1]:
+                    self.block[1] = level
+            elif local == "outlineLvl" and self._in_block_ppr():
+                val = _attr(attrs, "val") or ""
+                # 0-based; 9 means body text
+                if val.isdigit() and int(val) < 9:
+                    self.block[1] = int(val) + 1
+            elif local == "hyperlink":
+                anchor = _attr(attrs, "anchor")
+                if anchor:
+                    self.anchors[anchor] = None
+            elif local == "bookmarkStart":
+                if (_attr(attrs, "name") or "").startswith("heading_"):
+                    self.heading_bookmarks += 1
+            elif local == "body":
+                self.body_depth = self.depth
+        elif ns in _M_NS and local == "oMath":
+            r.equations += 1
+
+    def end(self, name: str) -> None:
+        ns, _, local = name.rpartition(" ")
+        if ns in _W_NS:
+            if local == "t":
+                self.in_text = False
+            elif local == "p":
+                self.lines += max(1, -(-self.para_chars // _LINE_CHARS))
+                if self.depth == self.body_depth + 1 and self.block is not None:
+                    if self.block[1]:
+                        self.r.headings += 1
+                        self.r.section_starts.append((self.block[0], self.block[1]))
+                    self.block = None
+            elif local == "body" and not self.r.body_range[1]:
+                self.r.body_range = (self.r.body_range[0], self.parser.CurrentByteIndex)
+        self.depth -= 1
+
+    def text(self, data: str) -> None:
+        if not self.in_text:
+            return
+        if self.first_text and data.strip():
+            self.first_text = False
+            if data.lstrip()[0] in _LIST_GLYPHS:
+                self.glyph_paragraphs += 1
+        self.para_chars += len(data)
+        self.r.characters += len(data)
+
+    def _in_block_ppr(self) -> bool:
+        # <w:body><w:p><w:pPr><w:pStyle>: not paragraphs nested in text boxes
+        return self.block is not None and self.depth == self.body_depth + 3
+
+
+def _attr(attrs: Dict[str, str], local: str) -> Optional[str]:
+    for key, value in attrs.items():
+        if key.rpartition(" ")[2] == local:
+            return value
+    return None
+
+
+def _heading_styles(zf: zipfile.ZipFile, names: set) -> Tuple[Dict[str, int], bool]:
+    """styleId -> heading level from word/styles.xml, and whether it defines any style."""
+
+    styles: Dict[str, int] = {}
+    if "word/styles.xml" not in names:
+        return styles, False
+    data = zf.read("word/styles.xml")
+    if not _STYLE_RE.search(data):
+        return styles, False
+    current: List[Optional[str]] = [None]
+
+    def start(name, attrs):
+        local = name.rpartition(" ")[2]
+        if local == "style":
+            current[0] = _attr(attrs, "styleId")
+            m = _HEADING_ID_RE.match(current[0] or "")
+            if m:
+                styles[current[0]] = int(m.group(1))
+        elif local == "name" and current[0]:
+            m = _HEADING_STYLE_RE.match(_attr(attrs, "val") or "")
+            if m:
+                styles[current[0]] = int(m.group(1))
+        elif local == "outlineLvl" and current[0]:
+            val = _attr(attrs, "val") or ""
+            if val.isdigit() and int(val) < 9:
+                styles.setdefault(current[0], int(val) + 1)
+
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.StartElementHandler = start
+    parser.Parse(data, True)
+    return styles, True
+
+
+def inspect(docx_path: Union[str, Path]) -> DocxInspection:
+    """Counts and size estimates for a .docx; raises `ConversionRejected` if it isn't one."""
+
+    started = time.perf_counter()
+    cost = estimate_cost(docx_path)
+    result = DocxInspection(cost=cost)
+    markers: List[str] = []
+    try:
+        with zipfile.ZipFile(docx_path) as zf:
+            names = set(zf.namelist())
+            app_xml = zf.read("docProps/app.xml") if "docProps/app.xml" in names else b""
+            heading_styles, has_styles = _heading_styles(zf, names)
+            result.document_xml_bytes = zf.getinfo("word/document.xml").file_size
+
+            parser = expat.ParserCreate(namespace_separator=" ")
+            parser.buffer_text = True
+            scanner = _Scanner(parser, heading_styles, result)
+            parser.StartElementHandler = scanner.start
+            parser.EndElementHandler = scanner.end
+            parser.CharacterDataHandler = scanner.text
+            with zf.open("word/document.xml") as stream:
+                while True:
+                    chunk = stream.read(_CHUNK)
+                    parser.Parse(chunk, not chunk)
+                    if not chunk:
+                        break
+    except (zipfile.BadZipFile, OSError, KeyError, expat.ExpatError, RuntimeError) as e:
+        raise ConversionRejected("invalid_docx", f"Not a valid .docx file: {e}", status_code=400) from e
+
+    app_name = _APP_RE.search(app_xml)
+    if app_name and b"Apache POI" in app_name.group(1):
+        markers.append("apache_poi")
+    if not has_styles:
+        markers.append("inline_styles")
+    if scanner.heading_bookmarks:
+        markers.append("heading_bookmarks")
+    if scanner.numeric_styles:
+        markers.append("numeric_styles")
+    if scanner.glyph_paragraphs:
+        markers.append("glyph_lists")
+    result.feishu_markers = markers
+    result.link_anchors = list(scanner.anchors)
+
+    pages = _PAGES_RE.search(app_xml)
+    if pages and int(pages.group(1)) > 0:
+        result.pages, result.pages_source = int(pages.group(1)), "app.xml"
+    elif result.page_breaks:
+        result.pages, result.pages_source = result.page_breaks + 1, "rendered"
+    else:
+        lines = scanner.lines + _IMAGE_LINES * result.images + result.table_rows
+        result.pages = max(1, -(-lines // _PAGE_LINES))
+    result.elapsed_ms = round(1000 * (time.perf_counter() - started), 2)
+    return result
@@ -0,0 +1,264 @@
+"""Portable exports of a converted document.
+
+Two formats, both produced as a stream of chunks so neither the archive nor
+the inlined page is ever held in memory as a whole:
+
+- "zip": `index.html` linking `assets/...` relatively, the asset files and
+  `manifest.json`; works wherever it is unpacked;
+- "html": one page; local images up to `inline_max_kb` become data: URIs,
+  larger ones keep their URL (prefixed with EXPORT_ASSET_BASE_URL).
+
+Virtualized tables are expanded back to full tables, so neither format needs
+JavaScript. Finished bundles are cached under EXPORT_CACHE_DIR, keyed by the
+document's source_hash + css_version (plus doc_id, format, threshold, title and
+a digest of the stored HTML, tables and asset list, which can change without
+a new source file), and served from there afterwards; documents without a
+source_hash are never cached.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.env import env_int
+from app.services.preview import render_page
+from app.services.tables import expand_virtual_tables
+
+
+EXPORT_FORMATS = ("zip", "html")
+INLINE_MAX_KB = env_int("EXPORT_INLINE_MAX_KB", 64)
+# Empty disables the cache
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "out/exports")
+EXPORT_CACHE_MAX = env_int("EXPORT_CACHE_MAX", 200)
+ASSET_BASE_URL = os.getenv("EXPORT_ASSET_BASE_URL", "").rstrip("/")
+ASSETS_DIR = Path("public/assets")
+ASSETS_URL = "/assets/"
+
+_CHUNK = 1 << 16
+# Multiple of 3, so base64 chunks concatenate without padding
+_B64_CHUNK = 3 * (1 << 14)
+_ASSET_SRC_RE = re.compile(r'(?<=\ssrc=")/assets/[^"]+(?=")')
+# Already compressed; stored as-is in the ZIP
+_STORED_EXTS = frozenset((".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip", ".gz", ".mp4"))
+
+
+@dataclass
+class ExportSource:
+    """What an export is built from: a stored (or just converted) document."""
+
+    doc_id: str
+    title: str
+    # Sanitized fragment, as stored
+    html: str
+    tables: List[Dict[str, Any]] = field(default_factory=list)
+    # Asset manifest entries (name, url, digest, size, mime, width, height)
+    assets: List[Dict[str, Any]] = field(default_factory=list)
+    source_hash: Optional[str] = None
+    css_version: Optional[str] = None
+
+    def cache_key(self, fmt: str, inline_max_kb: int) -> Optional[str]:
+        if not self.source_hash:
+            return None
+        # The same file uploaded under two doc_ids links different asset URLs
+        variant = json.dumps([self.doc_id, fmt, inline_max_kb if fmt == "html" else None, self.title], ensure_ascii=False)
+        h = hashlib.sha256(variant.encode("utf-8"))
+        h.update(self.content_digest().encode("ascii"))
+        return f"{self.source_hash}-{self.css_version or 'none'}-{h.hexdigest()[:16]}"
+
+    def content_digest(self) -> str:
+        """Digest of what is exported; a re-upload can change it for the same source_hash."""
+
+        h = hashlib.sha256(self.html.encode("utf-8"))
+        for part in (self.tables, [(a.get("url"), a.get("digest")) for a in self.assets]):
+            h.update(b"\0")
+            h.update(json.dumps(part, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        return h.hexdigest()
+
+
+def export_media_type(fmt: str) -> str:
+    return "application/zip" if fmt == "zip" else "text/html; charset=utf-8"
+
+
+def export_filename(src: ExportSource, fmt: str) -> str:
+    return f"{src.doc_id or 'document'}.{fmt}"
+
+
+def inline_threshold_kb(inline_max_kb: Optional[int]) -> int:
+    return INLINE_MAX_KB if inline_max_kb is None else max(0, inline_max_kb)
+
+
+def local_asset(url: str, assets_dir: Path = ASSETS_DIR) -> Optional[Path]:
+    """File behind an `/assets/...` URL, if it exists under `assets_dir`."""
+
+    if not url.startswith(ASSETS_URL):
+        return None
+    root = assets_dir.resolve()
+    path = (root / url[len(ASSETS_URL):]).resolve()
+    if root not in path.parents or not path.is_file():
+        return None
+    return path
+
+
+def stream_export(src: ExportSource, fmt: str, inline_max_kb: Optional[int] = None) -> Iterator[bytes]:
+    """Chunks of the export; from the cache when this bundle was built before."""
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    inline_max_kb = inline_threshold_kb(inline_max_kb)
+    chunks = iter_zip(src) if fmt == "zip" else iter_html(src, inline_max_kb << 10)
+    key = src.cache_key(fmt, inline_max_kb)
+    if not EXPORT_CACHE_DIR or key is None:
+        return chunks
+    cached = Path(EXPORT_CACHE_DIR) / f"{key}.{fmt}"
+    if cached.is_file():
+        _touch(cached)
+        return _iter_file(cached)
+    return _tee_to_cache(chunks, cached)
+
+
+def iter_zip(src: ExportSource, assets_dir: Path = ASSETS_DIR) -> Iterator[bytes]:
+    sink = _Sink()
+    arcnames: Dict[str, str] = {}
+    files: List[tuple] = []
+    for asset in src.assets:
+        path = local_asset(asset["url"], assets_dir)
+        if path is not None and asset["url"] not in arcnames:
+            arcnames[asset["url"]] = "assets/" + asset["url"][len(ASSETS_URL):]
+            files.append((arcnames[asset["url"]], path))
+
+    def relink(html: str) -> str:
+        return _ASSET_SRC_RE.sub(lambda m: arcnames.get(m.group(0), m.group(0)), html)
+
+    page = render_page(src.title, relink(expand_virtual_tables(src.html, src.tables)))
+    manifest = {
+        "doc_id": src.doc_id,
+        "title": src.title,
+        "source_hash": src.source_hash,
+        "css_version": src.css_version,
+        "assets": [{**a, "path": arcnames.get(a["url"])} for a in src.assets],
+    }
+    # Not seekable: zipfile writes data descriptors after each member
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("index.html", page)
+        yield sink.drain()
+        for arcname, path in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED if path.suffix.lower() in _STORED_EXTS else zipfile.ZIP_DEFLATED
+            with path.open("rb") as f, zf.open(info, "w") as dest:
+                while True:
+                    block = f.read(_CHUNK)
+                    if not block:
+                        break
+                    dest.write(block)
+                    yield sink.drain()
+            yield sink.drain()
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    yield sink.drain()
+
+
+def iter_html(src: ExportSource, inline_max_bytes: int, assets_dir: Path = ASSETS_DIR) -> Iterator[bytes]:
+    mimes = {a["url"]: a.get("mime") for a in src.assets}
+    page = render_page(src.title, expand_virtual_tables(src.html, src.tables))
+    pos = 0
+    for m in _ASSET_SRC_RE.finditer(page):
+        yield page[pos:m.start()].encode("utf-8")
+        pos = m.end()
+        url = m.group(0)
+        path = local_asset(url, assets_dir)
+        if path is None or path.stat().st_size > inline_max_bytes:
+            yield (ASSET_BASE_URL + url).encode("utf-8")
+            continue
+        mime = mimes.get(url) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        yield f"data:{mime};base64,".encode("ascii")
+        with path.open("rb") as f:
+            while True:
+                block = f.read(_B64_CHUNK)
+                if not block:
+                    break
+                yield base64.b64encode(block)
+    yield page[pos:].encode("utf-8")
+
+
+class _Sink:
+    """Write-only file object collecting what zipfile writes until drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_file(path: Path) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            block = f.read(_CHUNK)
+            if not block:
+                return
+            yield block
+
+
+def _tee_to_cache(chunks: Iterator[bytes], cached: Path) -> Iterator[bytes]:
+    """Pass chunks through while writing them to the cache.
+
+    The file is renamed into place only once the whole bundle was produced,
+    so an aborted download never leaves a truncated bundle behind.
+    """
+
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cached.parent, prefix=".tmp-", suffix=cached.suffix)
+    complete = False
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in chunks:
+                if chunk:
+                    out.write(chunk)
+                    yield chunk
+        os.replace(tmp, cached)
+        complete = True
+        _prune_cache(cached.parent)
+    finally:
+        if not complete:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+def _prune_cache(cache_dir: Path) -> None:
+    # Oldest first (by last use); mtimes are refreshed on cache hits
+    if EXPORT_CACHE_MAX <= 0:
+        return
+    entries = [p for p in cache_dir.iterdir() if p.is_file() and not p.name.startswith(".tmp-")]
+    if len(entries) <= EXPORT_CACHE_MAX:
+        return
+    entries.sort(key=lambda p: p.stat().st_mtime)
+    for p in entries[: len(entries) - EXPORT_CACHE_MAX]:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+
+
+def _touch(path: Path) -> None:
+    now = time.time()
+    os.utime(path, (now, now))
@@ -0,0 +1,256 @@
+"""Single-pass allowlist sanitizer.
+
+Does what `bleach.clean(strip=True)` followed by `bleach.linkify` does for
+this project's policy, but with one `html.parser` tokenizer pass instead of
+two html5lib parse/serialize round trips:
+
+- disallowed tags are dropped and their text kept (a dropped block-level
+  start tag becomes a newline); comments, doctypes and processing
+  instructions are dropped;
+- attributes outside the per-tag allowlist are dropped, and `href`/`src`
+  values with a scheme other than http/https/mailto are dropped;
+- `<a href>` gets `rel="noopener noreferrer"`;
+- URLs in text outside `<a>` are linkified, only for text nodes that look
+  like they contain one.
+
+The output is always balanced: stray end tags are dropped and open tags are
+closed at the end, so input can never close the `lark-article` wrapper.
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from html import escape
+from html.parser import HTMLParser
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+
+ALLOWED_PROTOCOLS = frozenset(("http", "https", "mailto"))
+REL_VALUE = "noopener noreferrer"
+
+_VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"))
+_URI_ATTRS = frozenset(("href", "src", "action", "background", "cite", "formaction", "longdesc", "poster", "xlink:href"))
+# Same normalization as bleach's sanitize_uri_value
+_URI_JUNK_RE = re.compile(r"[`\000-\040\177-\240\s]+")
+# C0 controls except \t \n \r; bleach replaces them with "?"
+_INVISIBLE_RE = re.compile("[\x01-\x08\x0b\x0c\x0e-\x1f]")
+_PROTO_RE = re.compile(r"^[\w-]+:/{0,3}", re.I)
+# Stripping one of these leaves a newline (bleach does the same), so text
+# from adjacent blocks doesn't run together
+_BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "details", "dialog", "dd", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hgroup", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "ul",
+))
+# html5lib drops a newline directly after these start tags, except inside
+# a table cell or caption, where its parser skips that step
+_NEWLINE_DROPPING_TAGS = frozenset(("pre", "textarea", "listing"))
+_CELL_TAGS = frozenset(("td", "th", "caption"))
+
+
+@lru_cache(maxsize=None)
+def _url_re() -> "re.Pattern[str]":
+    # bleach's URL regex (with its TLD list) keeps linkify output identical;
+    # a scheme-only pattern is used when bleach isn't installed
+    try:
+        from bleach.linkifier import URL_RE  # type: ignore
+    except Exception:
+        URL_RE = re.compile(r"\(*\b(?:https?|mailto):/{0,3}[\w.-]+(?:[/?][^\s{}|\\^`<>\"]*)?", re.I)
+    return URL_RE
+
+
+def is_safe_uri(value: str, protocols: FrozenSet[str] = ALLOWED_PROTOCOLS) -> bool:
+    """Whether an href/src value may be kept.
+
+    `value` is entity-decoded, i.e. what the browser will resolve.
+    """
+
+    normalized = _URI_JUNK_RE.sub("", value).replace("\ufffd", "").lower()
+    try:
+        scheme = urlparse(normalized).scheme
+    except ValueError:
+        return False
+    # No scheme: relative URL or anchor
+    return not scheme or scheme in protocols
+
+
+def _strip_non_url_bits(fragment: str) -> Tuple[str, str, str]:
+    # Port of bleach's LinkifyFilter.strip_non_url_bits
+    prefix = suffix = ""
+    while fragment:
+        if fragment.startswith("("):
+            prefix += "("
+            fragment = fragment[1:]
+            if fragment.endswith(")"):
+                suffix = ")" + suffix
+                fragment = fragment[:-1]
+            continue
+        if fragment.endswith(")") and "(" not in fragment:
+            fragment = fragment[:-1]
+            suffix = ")" + suffix
+            continue
+        if fragment[-1] in ",.":
+            suffix = fragment[-1] + suffix
+            fragment = fragment[:-1]
+            continue
+        break
+    return fragment, prefix, suffix
+
+
+@lru_cache(maxsize=4096)
+def linkify_text(text: str) -> str:
+    """Escape a text node and wrap URLs in `<a href rel>`.
+
+    Cached: the same link texts tend to repeat throughout a document.
+    """
+
+    out: List[str] = []
+    end = 0
+    for m in _url_re().finditer(text):
+        url, prefix, suffix = _strip_non_url_bits(m.group(0))
+        href = url if _PROTO_RE.search(url) else f"http://{url}"
+        if not is_safe_uri(href):
+            # bleach.linkify would also link ftp:, feed:, data: ...; leave as text
+            continue
+        out.append(escape(text[end:m.start()] + prefix, quote=False))
+        out.append(f'<a href="{escape(href)}" rel="{REL_VALUE}">{escape(url, quote=False)}</a>')
+        out.append(escape(suffix, quote=False))
+        end = m.end()
+    out.append(escape(text[end:], quote=False))
+    return "".join(out)
+
+
+class AllowlistSanitizer:
+    """Compiled tag/attribute allowlist; `clean()` is safe to call from many threads."""
+
+    def __init__(
+        self,
+        tags: Iterable[str],
+        attributes: Mapping[str, Iterable[str]],
+        protocols: Iterable[str] = ALLOWED_PROTOCOLS,
+        linkify: bool = True,
+    ):
+        self.tags = frozenset(tags)
+        self.attributes: Dict[str, FrozenSet[str]] = {t: frozenset(a) for t, a in attributes.items()}
+        self.protocols = frozenset(protocols)
+        self.linkify = linkify
+
+    def clean(self, html: str) -> str:
+        parser = _FilterParser(self)
+        parser.feed(html)
+        parser.close()
+        return parser.result()
+
+
+class _FilterParser(HTMLParser):
+    # Tokenize <script>/<style> bodies as markup, like bleach does; the
+    # elements themselves are not allowed so only their text survives
+    CDATA_CONTENT_ELEMENTS = ()
+
+    def __init__(self, policy: AllowlistSanitizer):
+        super().__init__(convert_charrefs=True)
+        self.policy = policy
+        self.out: List[str] = []
+        self.stack: List[str] = []
+        self.text: List[str] = []
+        self.in_a = 0
+        # Set right after a <pre>/<textarea>/<listing> start tag
+        self.drop_newline = False
+
+    def result(self) -> str:
+        self._flush()
+        while self.stack:
+            self._pop()
+        return "".join(self.out)
+
+    def _pop(self) -> str:
+        tag = self.stack.pop()
+        if tag == "a":
+            self.in_a -= 1
+        self.out.append(f"</{tag}>")
+        return tag
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        policy = self.policy
+        if tag not in policy.tags:
+            if tag in _BLOCK_TAGS and self.getpos() != (1, 0):
+                self.text.append("\n")
+                self.drop_newline = False
+            return
+        self.drop_newline = tag in _NEWLINE_DROPPING_TAGS and _CELL_TAGS.isdisjoint(self.stack)
+        self._flush()
+        allowed = policy.attributes.get(tag, frozenset())
+        kept: Dict[str, str] = {}
+        seen = set()
+        for name, value in attrs:
+            # First occurrence wins, as in html5lib, even if it is then dropped
+            if name not in allowed or name in seen:
+                continue
+            seen.add(name)
+            value = "" if value is None else value.replace("\x00", "")
+            if name in _URI_ATTRS and not is_safe_uri(value, policy.protocols):
+                continue
+            kept[name] = _INVISIBLE_RE.sub("?", value)
+        if tag == "a" and "href" in kept:
+            kept["rel"] = REL_VALUE
+        attr_html = "".join(f' {k}="{escape(v)}"' for k, v in kept.items())
+        self.out.append(f"<{tag}{attr_html}>")
+        if tag in _VOID_TAGS:
+            return
+        self.stack.append(tag)
+        if tag == "a":
+            self.in_a += 1
+
+    # As in HTML: "/>" only closes void elements
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack:
+            return
+        self.drop_newline = False
+        self._flush()
+        while self._pop() != tag:
+            pass
+
+    def handle_data(self, data):
+        # Text on both sides of a stripped tag is one text node (as after
+        # bleach.clean), and html.parser may deliver it in several pieces
+        if self.drop_newline:
+            self.drop_newline = False
+            # One newline directly after an allowed <pre>, <textarea> or
+            # <listing> (CRLF counts as one); bleach strips other tags before
+            # html5lib sees them, so those in between don't matter
+            if data.startswith("\r\n"):
+                data = data[2:]
+            elif data[:1] in ("\n", "\r"):
+                data = data[1:]
+        self.text.append(data)
+
+    def _flush(self) -> None:
+        if not self.text:
+            return
+        data = "".join(self.text)
+        self.text.clear()
+        if "\x00" in data:
+            data = data.replace("\x00", "")
+        data = _INVISIBLE_RE.sub("?", data)
+        # Every URL match needs a dot before the TLD
+        if self.policy.linkify and not self.in_a and "." in data:
+            self.out.append(linkify_text(data))
+        else:
+            self.out.append(escape(data, quote=False))
+
+    # Comments, doctypes, CDATA and processing instructions are dropped;
+    # html5lib keeps the others as comments, so a newline after one stays
+    def handle_comment(self, data):
+        self.drop_newline = False
+
+    def handle_decl(self, decl):
+        pass
+
+    def unknown_decl(self, data):
+        self.drop_newline = False
+
+    def handle_pi(self, data):
+        self.drop_newline = False
@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import re
 from pathlib import Path
+from typing import Dict, Optional
+
+from app.services.tables import stash_tables, restore_tables
 
 
 _P_STRONG_ONLY_RE = re.compile(r"<p>\s*<strong>(.*?)</strong>\s*</p>", re.I | re.S)
@@ -10,21 +13,68 @@ _IMG_TAG_RE = re.compile(r"<img\b([^>]*?)>", re.I)
 _TABLE_OPEN_RE = re.compile(r"<table\b", re.I)
 _TABLE_CLOSE_RE = re.compile(r"</table>", re.I)
 _SRC_RE = re.compile(r"src=(['\"])([^'\"]+)\1", re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+_SLUG_STRIP_RE = re.compile(r"[^\w\-\u4e00-\u9fff]+", re.UNICODE)
+NUMBERED_RE = re.compile(r"\s*\d+(?:[\.\d]*)?\s+")
+_HEADING_RE = re.compile(r"<(h[1-6])(\b[^>]*)>(.*?)</h[1-6]>", re.I | re.S)
+_HAS_ID_RE = re.compile(r"\bid=\"", re.I)
+_ID_ATTR_RE = re.compile(r"\bid=\"([^\"]*)\"", re.I)
+_LOADING_RE = re.compile(r"\bloading=", re.I)
+_P_SPLIT_RE = re.compile(r"(<p\b[^>]*>.*?</p>)", re.I | re.S)
+_LIST_BREAK_RE = re.compile(r"<(?:div|h[1-6]|table|ul|ol|blockquote|pre)\b", re.I)
+# One pass for every supported list prefix; the named group gives the list
+# type and match.end() is where the item text starts.
+LIST_ITEM_RE = re.compile(
+    r"(?:(?P<ul>[•●○◦·]|[-*])"
+    r"|(?P<ol>\d+[.、)]|[(（](?:\d+|[一二三四五六七八九十]+)[)）]|[一二三四五六七八九十]+、))"
+    r"\s+"
+)
 
 
 def _slugify(text: str) -> str:
-    s = re.sub(r"\s+", "-", text.strip())
-    s = re.sub(r"[^\w\-\u4e00-\u9fff]+", "", s, flags=re.UNICODE)
+    s = _WS_RE.sub("-", text.strip())
+    s = _SLUG_STRIP_RE.sub("", s)
     return s[:80] or "section"
 
 
-def promote_strong_paragraphs_to_headings(html: str) -> str:
+def unique_slug(text: str, seen: Optional[Dict[str, int]]) -> str:
+    """Slugify and, when `seen` is given, suffix -2, -3 ... to avoid duplicates.
+
+    `seen` maps every id already used to the last suffix handed out for it,
+    so repeated headings don't rescan from -2 each time.
+    """
+
+    slug = _slugify(text)
+    if seen is None:
+        return slug
+    if slug not in seen:
+        seen[slug] = 1
+        return slug
+    n = seen[slug]
+    candidate = slug
+    while candidate in seen:
+        n += 1
+        candidate = f"{slug}-{n}"
+    seen[slug] = n
+    seen[candidate] = 1
+    return candidate
+
+
+def collect_ids(html: str) -> Dict[str, int]:
+    """Ids already present in the document, to seed slug deduplication."""
+
+    if "id=" not in html:
+        return {}
+    return dict.fromkeys(_ID_ATTR_RE.findall(html), 1)
+
+
+def promote_strong_paragraphs_to_headings(html: str, seen: Optional[Dict[str, int]] = None) -> str:
     def repl(m: re.Match) -> str:
         content = m.group(1).strip()
         # Heuristic: if content is not too long or looks numbered, treat as heading
-        is_numbered = re.match(r"^\s*\d+(?:[\.\d]*)?\s+", content)
-        if is_numbered or len(content) <= 80:
-            hid = _slugify(content)
+        if len(content) <= 80 or NUMBERED_RE.match(content):
+            hid = unique_slug(content, seen)
             return f'<h2 id="{hid}">{content}</h2>'
         return m.group(0)
 
@@ -38,7 +88,7 @@ def ensure_img_lazy_and_strip_inline_styles(html: str) -> str:
     # Ensure loading="lazy"
     def img_repl(m: re.Match) -> str:
         attrs = m.group(1)
-        if re.search(r"\bloading=", attrs, re.I) is None:
+        if _LOADING_RE.search(attrs) is None:
             attrs = attrs.rstrip() + ' loading="lazy"'
         return f"<img{attrs}>"
 
@@ -53,28 +103,35 @@ def wrap_tables_with_container(html: str) -> str:
     return html
 
 
-def add_heading_ids(html: str) -> str:
+def add_heading_ids(html: str, seen: Optional[Dict[str, int]] = None) -> str:
     # For any h1-h6 without id, generate one from text
     def repl(m: re.Match) -> str:
         tag = m.group(1)
         attrs = m.group(2)
         inner = m.group(3)
-        if re.search(r"\bid=\"", attrs, re.I):
+        if _HAS_ID_RE.search(attrs):
             return m.group(0)
-        hid = _slugify(re.sub(r"<[^>]+>", "", inner))
+        hid = unique_slug(_TAG_RE.sub("", inner), seen)
         return f"<{tag} id=\"{hid}\"{attrs}>{inner}</{tag}>"
 
-    pattern = re.compile(r"<(h[1-6])(\b[^>]*)>(.*?)</h[1-6]>", re.I | re.S)
-    return pattern.sub(repl, html)
+    return _HEADING_RE.sub(repl, html)
+
+
+def _finish_table(table: str) -> str:
+    if "<img" in table:
+        table = ensure_img_lazy_and_strip_inline_styles(table)
+    return wrap_tables_with_container(table)
 
 
 def process_all(html: str) -> str:
-    html = promote_strong_paragraphs_to_headings(html)
-    html = wrap_tables_with_container(html)
+    # Tables are set aside so the paragraph passes never scan their cells
+    html, tables = stash_tables(html)
+    seen = collect_ids(html)
+    html = promote_strong_paragraphs_to_headings(html, seen)
     html = paragraphs_to_lists(html)
     html = ensure_img_lazy_and_strip_inline_styles(html)
-    html = add_heading_ids(html)
-    return html
+    html = add_heading_ids(html, seen)
+    return restore_tables(html, tables, _finish_table)
 
 
 def paragraphs_to_lists(html: str) -> str:
@@ -86,99 +143,72 @@ def paragraphs_to_lists(html: str) -> str:
       • ● ○ ◦ · 以及 "- ", "* ";
       数字/中文数字 + . 或 、 或 ) 或 ）：如 "1. ", "1) ", "1、", "（一）"、"(1)"。
     """
-    # Tokenize by <p>...</p> boundaries (retain delimiters)
-    parts = re.split(r"(<p\b[^>]*>.*?</p>)", html, flags=re.I | re.S)
+    # Tokenize by <p>...</p> boundaries: [gap, <p>, gap, <p>, ..., gap]
+    parts = _P_SPLIT_RE.split(html)
+    if len(parts) == 1:
+        return html
+
+    # Classify every paragraph exactly once; the lookahead reuses the result.
+    # The opening tag has no '>' inside, so the inner text starts after it.
+    items = [_classify_list_item(p[p.index(">") + 1:-4]) for p in parts[1::2]]
+    track_tables = _TABLE_OPEN_RE.search(html) is not None
+
     out = []
-    i = 0
     in_table = 0
-    in_list = False
-    list_type = None  # 'ul' or 'ol'
-
-    def classify(text: str):
-        t = re.sub(r"<[^>]+>", "", text).strip()
-        # Bullet symbols
-        if re.match(r"^(•|●|○|◦|·)\s+", t):
-            return 'ul', re.sub(r"^(•|●|○|◦|·)\s+", "", t)
-        if re.match(r"^(-|\*)\s+", t):
-            return 'ul', re.sub(r"^(-|\*)\s+", "", t)
-        # Numbered (Arabic or Chinese numerals)
-        if re.match(r"^\d+[\.、\)]\s+", t):
-            return 'ol', re.sub(r"^\d+[\.、\)]\s+", "", t)
-        if re.match(r"^[\(（](\d+|[一二三四五六七八九十]+)[\)）]\s+", t):
-            return 'ol', re.sub(r"^[\(（](\d+|[一二三四五六七八九十]+)[\)）]\s+", "", t)
-        if re.match(r"^[一二三四五六七八九十]+[、]\s+", t):
-            return 'ol', re.sub(r"^[一二三四五六七八九十]+[、]\s+", "", t)
-        return None, None
+    list_type = None  # 'ul' or 'ol' while a list is open
 
-    while i < len(parts):
-        seg = parts[i]
+    for i, seg in enumerate(parts):
         # Track table enter/exit
-        if re.search(r"<table\b", seg, flags=re.I):
-            in_table += 1
-        if re.search(r"</table>", seg, flags=re.I):
-            in_table = max(0, in_table - 1)
+        if track_tables:
+            if _TABLE_OPEN_RE.search(seg):
+                in_table += 1
+            if _TABLE_CLOSE_RE.search(seg):
+                in_table = max(0, in_table - 1)
 
-        m = re.match(r"^<p\b[^>]*>(.*?)</p>$", seg, flags=re.I | re.S)
-        if not m:
+        if i % 2 == 0:
             # Non-paragraph segment
             # Close any open list before emitting a block element that is not <p>
-            if in_list and re.search(r"<(?:div|h[1-6]|table|ul|ol|blockquote|pre)\b", seg, flags=re.I):
-                out.append(f"</{list_type}>")
-                in_list = False
-                list_type = None
-            out.append(seg)
-            i += 1
-            continue
-
-        inner = m.group(1)
-        if in_table > 0:
-            # Don't convert inside table cells
-            if in_list:
+            if list_type and _LIST_BREAK_RE.search(seg):
                 out.append(f"</{list_type}>")
-                in_list = False
                 list_type = None
             out.append(seg)
-            i += 1
             continue
 
-        kind, item_text = classify(inner)
-        if not kind:
-            # Close list if open
-            if in_list:
+        idx = i // 2
+        kind, item_text = items[idx]
+        # Don't convert inside table cells; a non-item paragraph ends the list
+        if in_table > 0 or not kind:
+            if list_type:
                 out.append(f"</{list_type}>")
-                in_list = False
                 list_type = None
             out.append(seg)
-            i += 1
             continue
 
         # Lookahead to ensure at least 2 consecutive items of same type
-        if not in_list:
-            # Peek next paragraph
-            next_is_same = False
-            if i + 2 < len(parts):
-                m2 = re.match(r"^<p\b[^>]*>(.*?)</p>$", parts[i+2], flags=re.I | re.S)
-                if m2:
-                    k2, _ = classify(m2.group(1))
-                    next_is_same = (k2 == kind)
+        if not list_type:
+            next_is_same = idx + 1 < len(items) and items[idx + 1][0] == kind
             if not next_is_same:
                 # Not enough to be a list; keep as-is
                 out.append(seg)
-                i += 1
                 continue
             # Open list
             out.append(f"<{kind}>")
-            in_list = True
             list_type = kind
 
         # Append item
         out.append(f"<li>{item_text}</li>")
-        i += 1
-
-        # If next paragraph is not same kind, close list in next loop iteration
-        # (Handled at top when non-list paragraph encountered.)
 
     # Close any dangling list
-    if in_list:
+    if list_type:
         out.append(f"</{list_type}>")
     return "".join(out)
+
+
+def _classify_list_item(inner: str):
+    """Return ('ul' | 'ol', item text) for a list-like paragraph, else (None, None)."""
+
+    t = (_TAG_RE.sub("", inner) if "<" in inner else inner).strip()
+    m = LIST_ITEM_RE.match(t)
+    if not m:
+        return None, None
+    return ("ul" if m.group("ul") else "ol"), t[m.end():]
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+def _png(head: bytes) -> Optional[Tuple[int, int]]:
+    if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+        return struct.unpack(">II", head[16:24])
+    return None
+
+
+def _gif(head: bytes) -> Optional[Tuple[int, int]]:
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return struct.unpack("<HH", head[6:10])
+    return None
+
+
+def _bmp(head: bytes) -> Optional[Tuple[int, int]]:
+    if head[:2] == b"BM" and len(head) >= 26:
+        w, h = struct.unpack("<ii", head[18:26])
+        return w, abs(h)
+    return None
+
+
+def _webp(head: bytes) -> Optional[Tuple[int, int]]:
+    if head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        w = int.from_bytes(head[24:27], "little") + 1
+        h = int.from_bytes(head[27:30], "little") + 1
+        return w, h
+    if chunk == b"VP8 ":
+        w, h = struct.unpack("<HH", head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
+
+
+def _jpeg(f) -> Optional[Tuple[int, int]]:
+    # Walk markers until a start-of-frame segment
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, 1)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_raw = f.read(2)
+        if len(length_raw) < 2:
+            return None
+        length = struct.unpack(">H", length_raw)[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:5])
+            return w, h
+        f.seek(length - 2, 1)
+
+
+_SNIFFERS = (("image/png", _png), ("image/gif", _gif), ("image/webp", _webp), ("image/bmp", _bmp))
+
+
+def probe_image(path: Union[str, Path]) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """Return (mime, width, height) by reading the file header.
+
+    Falls back to the extension for the mime type; dimensions are None for
+    formats that aren't recognized (e.g. EMF/WMF from Word).
+    """
+
+    path = Path(path)
+    try:
+        with path.open("rb") as f:
+            head = f.read(32)
+            for mime, sniff in _SNIFFERS:
+                dims = sniff(head)
+                if dims:
+                    return mime, dims[0], dims[1]
+            if head[:2] == b"\xff\xd8":
+                dims = _jpeg(f)
+                return "image/jpeg", dims[0] if dims else None, dims[1] if dims else None
+    except (OSError, struct.error):
+        pass
+    return mimetypes.guess_type(path.name)[0], None, None
+
+
+def describe_asset(path: Union[str, Path]) -> Dict[str, object]:
+    """Digest, size, mime and dimensions for an asset file."""
+
+    path = Path(path)
+    h = hashlib.sha256()
+    size = 0
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+            size += len(chunk)
+    mime, width, height = probe_image(path)
+    return {"digest": h.hexdigest(), "size": size, "mime": mime, "width": width, "height": height}
@@ -0,0 +1,568 @@
+"""Post-processing and HTML rendering on Pandoc's JSON AST.
+
+Alternative to running Pandoc's HTML writer and then re-parsing the output
+with `html_postprocess`: the same transformations (strong-only paragraphs to
+headings, bullet/numbered paragraphs to lists, heading ids, lazy images,
+table containers, image URL rewriting) are applied to the typed AST and the
+result is rendered to HTML in a single pass. Apart from those passes the
+markup is what Pandoc's HTML5 writer produces; `scripts/compare_split.py
+--baseline html` compares the two pipelines.
+"""
+from __future__ import annotations
+
+import re
+from html import escape
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from app.services.html_postprocess import LIST_ITEM_RE, NUMBERED_RE, unique_slug
+
+
+Block = Dict[str, Any]
+Inline = Dict[str, Any]
+
+_SIMPLE_CONTAINERS = {
+    "Emph": "em",
+    "Underline": "u",
+    "Strong": "strong",
+    "Strikeout": "s",
+    "Superscript": "sup",
+    "Subscript": "sub",
+}
+_BREAKS = ("Space", "SoftBreak", "LineBreak")
+
+
+def stringify(inlines: List[Inline]) -> str:
+    """Plain text of an inline list (notes and raw inlines excluded)."""
+
+    parts: List[str] = []
+    _stringify(inlines, parts)
+    return "".join(parts)
+
+
+def _stringify(inlines: List[Inline], parts: List[str]) -> None:
+    for il in inlines:
+        t = il["t"]
+        if t == "Str":
+            parts.append(il["c"])
+        elif t in _BREAKS:
+            parts.append(" ")
+        elif t in _SIMPLE_CONTAINERS or t == "SmallCaps":
+            _stringify(il["c"], parts)
+        elif t in ("Code", "Math"):
+            parts.append(il["c"][1])
+        elif t in ("Quoted", "Cite", "Link", "Image", "Span"):
+            _stringify(il["c"][1], parts)
+
+
+# ---------------------------------------------------------------------------
+# Passes
+# ---------------------------------------------------------------------------
+
+def _drop_chars(inlines: List[Inline], n: int) -> List[Inline]:
+    """Remove the first `n` characters (as counted by `stringify`)."""
+
+    out: List[Inline] = []
+    for idx, il in enumerate(inlines):
+        if n <= 0:
+            out.extend(inlines[idx:])
+            break
+        length = len(stringify([il]))
+        if length <= n:
+            n -= length
+            continue
+        t = il["t"]
+        if t == "Str":
+            out.append({"t": "Str", "c": il["c"][n:]})
+        elif t in _SIMPLE_CONTAINERS or t == "SmallCaps":
+            out.append({"t": t, "c": _drop_chars(il["c"], n)})
+        elif t in ("Span", "Link"):
+            c = list(il["c"])
+            c[1] = _drop_chars(c[1], n)
+            out.append({"t": t, "c": c})
+        else:
+            out.append(il)
+        n = 0
+    return out
+
+
+def _list_item(block: Block) -> Optional[Tuple[str, List[Inline]]]:
+    """('ul' | 'ol', inlines without the prefix) for a list-like paragraph."""
+
+    if block["t"] != "Para":
+        return None
+    inlines = block["c"]
+    text = stringify(inlines)
+    m = LIST_ITEM_RE.match(text, len(text) - len(text.lstrip()))
+    if not m:
+        return None
+    return ("ul" if m.group("ul") else "ol"), _drop_chars(inlines, m.end())
+
+
+def _strong_only(block: Block) -> Optional[List[Inline]]:
+    if block["t"] != "Para":
+        return None
+    inlines = [il for il in block["c"] if il["t"] not in _BREAKS]
+    if len(inlines) == 1 and inlines[0]["t"] == "Strong":
+        return inlines[0]["c"]
+    return None
+
+
+def _make_list(kind: str, items: List[List[Block]]) -> Block:
+    if kind == "ol":
+        return {"t": "OrderedList", "c": [[1, {"t": "DefaultStyle"}, {"t": "DefaultDelim"}], items]}
+    return {"t": "BulletList", "c": items}
+
+
+def transform_blocks(blocks: List[Block], seen: Dict[str, int]) -> List[Block]:
+    """Promote strong-only paragraphs to h2 and group list-like paragraphs.
+
+    Applied to the document body and to block quotes / divs; table cells and
+    existing list items are left alone. A list needs at least two adjacent
+    paragraphs of the same kind.
+    """
+
+    items = [_list_item(b) for b in blocks]
+    out: List[Block] = []
+    open_kind: Optional[str] = None
+    open_items: List[List[Block]] = []
+
+    for i, block in enumerate(blocks):
+        item = items[i]
+        if item:
+            kind, inlines = item
+            entry = [{"t": "Plain", "c": inlines}]
+            if open_kind == kind:
+                open_items.append(entry)
+                continue
+            nxt = items[i + 1] if i + 1 < len(items) else None
+            if nxt and nxt[0] == kind:
+                open_kind, open_items = kind, [entry]
+                out.append(_make_list(kind, open_items))
+                continue
+        open_kind = None
+
+        t = block["t"]
+        if t == "Para":
+            strong = _strong_only(block)
+            if strong:
+                content = stringify(strong).strip()
+                # Heuristic: if content is not too long or looks numbered, treat as heading
+                if content and (len(content) <= 80 or NUMBERED_RE.match(content)):
+                    hid = unique_slug(content, seen)
+                    block = {"t": "Header", "c": [2, [hid, [], []], strong]}
+        elif t == "BlockQuote":
+            block = {"t": t, "c": transform_blocks(block["c"], seen)}
+        elif t == "Div":
+            block = {"t": t, "c": [block["c"][0], transform_blocks(block["c"][1], seen)]}
+        out.append(block)
+    return out
+
+
+def _collect_header_ids(blocks: List[Block], seen: Dict[str, int]) -> None:
+    # Walk block containers only; inlines can't hold headers
+    for block in blocks:
+        t = block["t"]
+        c = block.get("c")
+        if t == "Header":
+            if c[1][0]:
+                seen.setdefault(c[1][0], 1)
+        elif t == "BlockQuote":
+            _collect_header_ids(c, seen)
+        elif t == "Div":
+            _collect_header_ids(c[1], seen)
+        elif t == "Figure":
+            _collect_header_ids(c[2], seen)
+        elif t == "BulletList" or t == "OrderedList":
+            for item in c if t == "BulletList" else c[1]:
+                _collect_header_ids(item, seen)
+
+
+# ---------------------------------------------------------------------------
+# Merging the parts of a split conversion
+# ---------------------------------------------------------------------------
+
+# First word of the paragraph the splitter appends to every part; Pandoc
+# resolves its links, which tells which bookmark became which heading id
+ANCHOR_PROBE = "fei2html-anchor-probe"
+_ID_SUFFIX_RE = re.compile(r"^(.*)-\d+$")
+
+
+def _find(node: Any, t: str, out: List[Dict[str, Any]]) -> None:
+    # Every element of type `t`, in document order
+    if isinstance(node, dict):
+        if node.get("t") == t:
+            out.append(node)
+        c = node.get("c")
+        if isinstance(c, list):
+            _find(c, t, out)
+    elif isinstance(node, list):
+        for x in node:
+            _find(x, t, out)
+
+
+def _probe_targets(blocks: List[Block]) -> Optional[List[str]]:
+    last = blocks[-1] if blocks else None
+    if not last or last["t"] not in ("Para", "Plain") or not last["c"]:
+        return None
+    first = last["c"][0]
+    if first["t"] != "Str" or first["c"] != ANCHOR_PROBE:
+        return None
+    links: List[Dict[str, Any]] = []
+    _find(last["c"], "Link", links)
+    return [link["c"][2][0] for link in links]
+
+
+def merge_parts(asts: List[Mapping[str, Any]], anchors: List[str]) -> Dict[str, Any]:
+    """One AST from the ASTs of consecutive parts of a document.
+
+    Pandoc's heading ids are only unique within a part: repeats are renamed
+    the way Pandoc renames them within one document (`-1`, `-2`, ...). Links
+    Pandoc resolved within a part follow that part's renames; links to
+    bookmarks (`anchors`) in other parts are pointed at the heading each
+    bookmark became, as read from the parts' probe paragraphs. Modifies the
+    part ASTs in place.
+    """
+
+    used: set = set()
+    bodies: List[List[Block]] = []
+    renames: List[Dict[str, str]] = []
+    local_ids: List[set] = []
+    bookmarks: Dict[str, str] = {}
+    for ast in asts:
+        blocks = list(ast["blocks"])
+        targets = _probe_targets(blocks) if anchors else None
+        if targets is not None:
+            blocks.pop()
+        headers: List[Dict[str, Any]] = []
+        _find(blocks, "Header", headers)
+        ids: set = set()
+        renamed: Dict[str, str] = {}
+        for header in headers:
+            attr = header["c"][1]
+            hid = attr[0]
+            if not hid:
+                continue
+            # "x-1" after "x" in the same part is Pandoc's own renaming of a repeat
+            m = _ID_SUFFIX_RE.match(hid)
+            base = m.group(1) if m and m.group(1) in ids else hid
+            ids.add(hid)
+            new = hid
+            if base != hid or hid in used:
+                n = 1
+                while f"{base}-{n}" in used:
+                    n += 1
+                new = f"{base}-{n}"
+            used.add(new)
+            if new != hid:
+                renamed[hid] = new
+                header["c"][1] = [new, *attr[1:]]
+        for anchor, target in zip(anchors, targets or ()):
+            if target.startswith("#") and target[1:] in ids:
+                bookmarks.setdefault(anchor, renamed.get(target[1:], target[1:]))
+        bodies.append(blocks)
+        renames.append(renamed)
+        local_ids.append(ids)
+
+    for blocks, renamed, ids in zip(bodies, renames, local_ids):
+        links: List[Dict[str, Any]] = []
+        _find(blocks, "Link", links)
+        for link in links:
+            url, title = link["c"][2]
+            if not url.startswith("#"):
+                continue
+            target = url[1:]
+            new = renamed.get(target, target) if target in ids else bookmarks.get(target, target)
+            if new != target:
+                link["c"][2] = ["#" + new, title]
+    return {**asts[0], "blocks": [b for blocks in bodies for b in blocks]}
+
+
+# ---------------------------------------------------------------------------
+# Writer
+# ---------------------------------------------------------------------------
+
+_ALIGNS = {"AlignLeft": "left", "AlignRight": "right", "AlignCenter": "center"}
+# <ol type> per list number style, as in Pandoc's HTML5 writer
+_OL_TYPES = {"Decimal": "1", "Example": "1", "LowerAlpha": "a", "UpperAlpha": "A", "LowerRoman": "i", "UpperRoman": "I"}
+# Attribute keys written as they are; Pandoc prefixes the others with data-
+_HTML_KEYS = frozenset(("style", "title", "lang", "dir", "width", "height"))
+
+
+def _attr_class(attr: List[Any]) -> str:
+    classes = attr[1] if attr else []
+    return f' class="{escape(" ".join(classes))}"' if classes else ""
+
+
+def _attrs(attr: List[Any]) -> str:
+    """id, class and key/value pairs of a Pandoc Attr."""
+
+    if not attr:
+        return ""
+    ident, _classes, kvs = attr
+    out = f' id="{escape(ident)}"' if ident else ""
+    out += _attr_class(attr)
+    for key, value in kvs:
+        if key not in _HTML_KEYS and not key.startswith("data-"):
+            key = "data-" + key
+        out += f' {key}="{escape(value)}"'
+    return out
+
+
+class HtmlWriter:
+    """HTML5 writer for the block/inline types Pandoc's docx reader emits.
+
+    Renders them as Pandoc's own HTML5 writer does (attributes, list
+    numbering, table widths and alignment), minus line wrapping.
+    """
+
+    def __init__(self, image_urls: Mapping[str, str], seen: Dict[str, int]):
+        self.image_urls = image_urls
+        self.seen = seen
+        self.notes: List[str] = []
+        self._resolved: Dict[str, Optional[str]] = {}
+
+    def render(self, blocks: List[Block]) -> str:
+        out: List[str] = []
+        self.blocks(blocks, out)
+        if self.notes:
+            out.append('<section class="footnotes"><hr /><ol>')
+            for n, note in enumerate(self.notes, 1):
+                out.append(f'<li id="fn{n}">{note}</li>')
+            out.append("</ol></section>")
+        return "".join(out)
+
+    def image_url(self, target: str) -> str:
+        """Map an extracted media path to its uploaded URL by full path."""
+
+        if target in self.image_urls:
+            return self.image_urls[target]
+        if target not in self._resolved:
+            self._resolved[target] = self.image_urls.get(str(Path(target).resolve()))
+        return self._resolved[target] or target
+
+    # -- blocks -------------------------------------------------------------
+
+    def blocks(self, blocks: List[Block], out: List[str]) -> None:
+        for block in blocks:
+            t = block["t"]
+            c = block.get("c")
+            if t == "Para":
+                out.append("<p>")
+                self.inlines(c, out)
+                out.append("</p>")
+            elif t == "Plain":
+                self.inlines(c, out)
+            elif t == "Header":
+                level, attr, inlines = c
+                hid = attr[0] or unique_slug(stringify(inlines), self.seen)
+                out.append(f'<h{level} id="{escape(hid)}">')
+                self.inlines(inlines, out)
+                out.append(f"</h{level}>")
+            elif t == "BulletList":
+                self._list("ul", c, out)
+            elif t == "OrderedList":
+                (start, style, _delim), items = c
+                attrs = f' start="{start}"' if start != 1 else ""
+                if style["t"] in _OL_TYPES:
+                    attrs += f' type="{_OL_TYPES[style["t"]]}"'
+                self._list("ol", items, out, attrs)
+            elif t == "Table":
+                self._table(c, out)
+            elif t == "BlockQuote":
+                out.append("<blockquote>")
+                self.blocks(c, out)
+                out.append("</blockquote>")
+            elif t == "CodeBlock":
+                out.append(f"<pre><code{_attr_class(c[0])}>{escape(c[1], quote=False)}</code></pre>")
+            elif t == "Figure":
+                attr, caption, body = c
+                out.append("<figure>")
+                self.blocks(body, out)
+                if caption[1]:
+                    out.append("<figcaption>")
+                    self.blocks(caption[1], out)
+                    out.append("</figcaption>")
+                out.append("</figure>")
+            elif t == "Div":
+                out.append(f"<div{_attrs(c[0])}>")
+                self.blocks(c[1], out)
+                out.append("</div>")
+            elif t == "LineBlock":
+                out.append("<p>")
+                for n, line in enumerate(c):
+                    if n:
+                        out.append("<br />")
+                    self.inlines(line, out)
+                out.append("</p>")
+            elif t == "DefinitionList":
+                out.append("<dl>")
+                for term, definitions in c:
+                    out.append("<dt>")
+                    self.inlines(term, out)
+                    out.append("</dt>")
+                    for definition in definitions:
+                        out.append("<dd>")
+                        self.blocks(definition, out)
+                        out.append("</dd>")
+                out.append("</dl>")
+            elif t == "HorizontalRule":
+                out.append("<hr />")
+            elif t == "RawBlock":
+                if c[0] == "html":
+                    out.append(c[1])
+
+    def _list(self, tag: str, items: List[List[Block]], out: List[str], attrs: str = "") -> None:
+        out.append(f"<{tag}{attrs}>")
+        for item in items:
+            out.append("<li>")
+            self.blocks(item, out)
+            out.append("</li>")
+        out.append(f"</{tag}>")
+
+    def _table(self, c: List[Any], out: List[str]) -> None:
+        attr, caption, colspecs, head, bodies, foot = c
+        # Relative column widths, 0 for default; like Pandoc's writer, a
+        # table narrower than the page gets its total width
+        widths = [w["c"] if w["t"] == "ColWidth" else 0 for _, w in colspecs]
+        aligns = [_ALIGNS.get(align["t"]) for align, _ in colspecs]
+        total = sum(widths)
+        style = f' style="width:{round(total * 100)}%;"' if 0 < total < 1 else ""
+        out.append(f'<div class="table-wrap"><table{_attrs(attr)}{style}>')
+        if caption[1]:
+            out.append("<caption>")
+            self.blocks(caption[1], out)
+            out.append("</caption>")
+        if any(widths):
+            out.append("<colgroup>")
+            for w in widths:
+                out.append(f'<col style="width: {int(100 * w)}%" />' if w else "<col />")
+            out.append("</colgroup>")
+        if head[1]:
+            out.append(f"<thead{_attrs(head[0])}>")
+            self._rows(head[1], aligns, 0, out, "th")
+            out.append("</thead>")
+        for body_attr, head_columns, head_rows, rows in bodies:
+            out.append(f"<tbody{_attrs(body_attr)}>")
+            self._rows(head_rows, aligns, len(aligns), out)
+            self._rows(rows, aligns, head_columns, out)
+            out.append("</tbody>")
+        if foot[1]:
+            out.append(f"<tfoot{_attrs(foot[0])}>")
+            self._rows(foot[1], aligns, 0, out)
+            out.append("</tfoot>")
+        out.append("</table></div>")
+
+    def _rows(self, rows: List[Any], aligns: List[Optional[str]], head_columns: int, out: List[str], tag: str = "td") -> None:
+        """Rows of one table section; cells in the first `head_columns` columns are <th>.
+
+        Cells without their own alignment take their column's, so columns
+        are counted the way the table lays out, rows spanned from above
+        included.
+        """
+
+        spanned: Dict[int, int] = {}
+        for row_attr, cells in rows:
+            out.append(f"<tr{_attrs(row_attr)}>")
+            col = 0
+            for cell_attr, align, rowspan, colspan, blocks in cells:
+                while spanned.get(col):
+                    col += 1
+                for n in range(col, col + colspan):
+                    spanned[n] = rowspan
+                cell_tag = "th" if col < head_columns else tag
+                extra = ""
+                if rowspan > 1:
+                    extra += f' rowspan="{rowspan}"'
+                if colspan > 1:
+                    extra += f' colspan="{colspan}"'
+                text_align = _ALIGNS.get(align["t"]) or (aligns[col] if col < len(aligns) else None)
+                if text_align:
+                    extra += f' style="text-align: {text_align};"'
+                out.append(f"<{cell_tag}{_attrs(cell_attr)}{extra}>")
+                self.blocks(blocks, out)
+                out.append(f"</{cell_tag}>")
+                col += colspan
+            spanned = {n: left - 1 for n, left in spanned.items() if left > 1}
+            out.append("</tr>")
+
+    # -- inlines ------------------------------------------------------------
+
+    def inlines(self, inlines: List[Inline], out: List[str]) -> None:
+        for il in inlines:
+            t = il["t"]
+            if t == "Str":
+                out.append(escape(il["c"], quote=False))
+            elif t == "Space" or t == "SoftBreak":
+                out.append(" ")
+            elif t in _SIMPLE_CONTAINERS:
+                tag = _SIMPLE_CONTAINERS[t]
+                out.append(f"<{tag}>")
+                self.inlines(il["c"], out)
+                out.append(f"</{tag}>")
+            elif t == "Image":
+                attr, alt, (target, title) = il["c"]
+                src = escape(self.image_url(target))
+                alt_text = stringify(alt)
+                alt_attr = f' alt="{escape(alt_text)}"' if alt_text else ""
+                title_attr = f' title="{escape(title)}"' if title else ""
+                out.append(f'<img src="{src}"{alt_attr}{title_attr} loading="lazy" />')
+            elif t == "Link":
+                attr, text, (url, title) = il["c"]
+                title_attr = f' title="{escape(title)}"' if title else ""
+                out.append(f'<a href="{escape(url)}"{_attrs(attr)}{title_attr}>')
+                self.inlines(text, out)
+                out.append("</a>")
+            elif t == "LineBreak":
+                # Pandoc's writer follows it with a newline too
+                out.append("<br />\n")
+            elif t == "Span":
+                attrs = _attrs(il["c"][0])
+                if attrs:
+                    out.append(f"<span{attrs}>")
+                    self.inlines(il["c"][1], out)
+                    out.append("</span>")
+                else:
+                    self.inlines(il["c"][1], out)
+            elif t == "Code":
+                out.append(f"<code{_attr_class(il['c'][0])}>{escape(il['c'][1], quote=False)}</code>")
+            elif t == "Math":
+                kind, tex = il["c"]
+                if kind["t"] == "DisplayMath":
+                    out.append(f'<span class="math display">\\[{escape(tex, quote=False)}\\]</span>')
+                else:
+                    out.append(f'<span class="math inline">\\({escape(tex, quote=False)}\\)</span>')
+            elif t == "Quoted":
+                kind, text = il["c"]
+                left, right = ("“", "”") if kind["t"] == "DoubleQuote" else ("‘", "’")
+                out.append(left)
+                self.inlines(text, out)
+                out.append(right)
+            elif t == "SmallCaps":
+                out.append('<span class="smallcaps">')
+                self.inlines(il["c"], out)
+                out.append("</span>")
+            elif t == "Cite":
+                self.inlines(il["c"][1], out)
+            elif t == "Note":
+                n = len(self.notes) + 1
+                note: List[str] = []
+                self.blocks(il["c"], note)
+                self.notes.append("".join(note))
+                out.append(f'<sup><a href="#fn{n}" id="fnref{n}">{n}</a></sup>')
+            elif t == "RawInline":
+                if il["c"][0] == "html":
+                    out.append(il["c"][1])
+
+
+def render_html(ast: Mapping[str, Any], image_urls: Mapping[str, str]) -> str:
+    """Apply the post-processing passes to a Pandoc AST and render HTML.
+
+    `image_urls` maps extracted media paths (resolved, absolute) to the URLs
+    they were uploaded to; images are matched by full path, not basename.
+    """
+
+    seen: Dict[str, int] = {}
+    _collect_header_ids(ast["blocks"], seen)
+    blocks = transform_blocks(ast["blocks"], seen)
+    return HtmlWriter(image_urls, seen).render(blocks)
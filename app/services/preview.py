@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+import json
 from dataclasses import dataclass
+from html import escape
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 
 @dataclass
@@ -17,9 +19,15 @@ def generate_preview_html(
     html_fragment: str,
     output_dir: Path = Path("out"),
     css_path: Path = Path("app/templates/article.css"),
+    tables: Optional[List[Dict[str, Any]]] = None,
 ) -> Optional[PreviewInfo]:
     """Generate a standalone HTML preview file for a converted document.
 
+    Row data of virtualized tables (see `virtualize_large_tables`) is embedded
+    and appended progressively as each placeholder scrolls into view. Images
+    keep their `/assets/...` URLs, so the preview must be served from the same
+    origin as the assets; `app.services.export` builds portable copies.
+
     Returns the relative path (str) to the generated file, or None if doc_id missing.
     """
 
@@ -27,17 +35,33 @@ def generate_preview_html(
         return None
 
     output_dir.mkdir(parents=True, exist_ok=True)
+    full_html = render_page(title or doc_id, html_fragment, css_path=css_path, tables=tables)
+
+    filename = f"{doc_id}_preview.html"
+    output_path = output_dir / filename
+    output_path.write_text(full_html, encoding="utf-8")
+
+    url = f"/out/{filename}"
+
+    return PreviewInfo(path=str(output_path), url=url)
+
+
+def render_page(
+    title: str,
+    html_fragment: str,
+    css_path: Path = Path("app/templates/article.css"),
+    tables: Optional[List[Dict[str, Any]]] = None,
+) -> str:
+    """Full HTML page around a sanitized fragment, with the article CSS inlined."""
 
     css_text = ""
     if css_path.exists():
         css_text = css_path.read_text(encoding="utf-8")
 
-    safe_title = title or doc_id
+    safe_title = escape(title, quote=False)
+    table_script = _table_script(tables) if tables else ""
 
-    # Adjust asset paths so the preview can be served statically from /out
-    preview_html = html_fragment.replace('src="/assets/', 'src="../assets/')
-
-    full_html = f"""<!doctype html>
+    return f"""<!doctype html>
 <html lang="zh-CN">
   <head>
     <meta charset="utf-8" />
@@ -52,15 +76,63 @@ def generate_preview_html(
   <body>
     <div class="page">
       <div style="margin-bottom:16px;color:#666;">{safe_title}</div>
-      {preview_html}
-    </div>
+      {html_fragment}
+    </div>{table_script}
   </body>
 </html>"""
 
-    filename = f"{doc_id}_preview.html"
-    output_path = output_dir / filename
-    output_path.write_text(full_html, encoding="utf-8")
 
-    url = f"/out/{filename}"
+_TABLE_LOADER_JS = """
+(function () {
+  var data = JSON.parse(document.getElementById('fei2html-tables').textContent);
+  function cell(c) {
+    if (typeof c === 'string') return '<td>' + c + '</td>';
+    return '<' + c[0] + (c[1] ? ' ' + c[1] : '') + '>' + c[2] + '</' + c[0] + '>';
+  }
+  function tbody(attrs) {
+    var tpl = document.createElement('template');
+    tpl.innerHTML = '<table><tbody' + (attrs ? ' ' + attrs : '') + '></tbody></table>';
+    return tpl.content.querySelector('tbody');
+  }
+  function render(ph, t, next) {
+    var end = Math.min(next + 100, t.rows.length), html = '';
+    // Legacy documents: div.table-virtual after the table
+    var legacy = ph.tagName !== 'TR';
+    function flush() {
+      if (!html) return;
+      if (legacy) ph.previousElementSibling.tBodies[0].insertAdjacentHTML('beforeend', html);
+      else ph.insertAdjacentHTML('beforebegin', html);
+      html = '';
+    }
+    for (var i = next; i < end; i++) {
+      var r = t.rows[i], meta = r[0] && typeof r[0] === 'object' && !Array.isArray(r[0]) ? r[0] : null;
+      if (meta && 'tbody' in meta && !legacy) {
+        flush();
+        var tb = tbody(meta.tbody);
+        ph.parentNode.after(tb);
+        tb.appendChild(ph);
+      }
+      html += '<tr' + (meta && meta.attrs ? ' ' + meta.attrs : '') + '>' + (meta ? r.slice(1) : r).map(cell).join('') + '</tr>';
+    }
+    flush();
+    return end;
+  }
+  var io = new IntersectionObserver(function (entries) {
+    entries.forEach(function (e) {
+      if (!e.isIntersecting) return;
+      var ph = e.target, t = data[+ph.dataset.tableIndex];
+      ph._next = render(ph, t, ph._next || 0);
+      if (ph._next >= t.rows.length) io.unobserve(ph);
+    });
+  }, { rootMargin: '400px' });
+  document.querySelectorAll('.table-virtual').forEach(function (ph) { io.observe(ph); });
+})();
+"""
 
-    return PreviewInfo(path=str(output_path), url=url)
+
+def _table_script(tables: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(tables, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    return (
+        f'\n    <script type="application/json" id="fei2html-tables">{payload}</script>'
+        f"\n    <script>{_TABLE_LOADER_JS}</script>"
+    )
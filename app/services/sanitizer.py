@@ -1,9 +1,34 @@
 from __future__ import annotations
 
-try:
-    import bleach  # type: ignore
-except Exception:  # graceful fallback if bleach not installed
-    bleach = None
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from app.env import env_int
+from app.services.fast_sanitizer import AllowlistSanitizer
+
+
+# "fast":   single html.parser pass (app/services/fast_sanitizer.py, default)
+# "bleach": bleach.clean + bleach.linkify (html5lib)
+DEFAULT_BACKEND = os.getenv("FEI2HTML_SANITIZER", "fast")
+# Sanitized documents kept in memory, keyed by input digest, up to a count
+# and a total size per process; 0 disables
+CACHE_SIZE = env_int("FEI2HTML_SANITIZE_CACHE", 32)
+CACHE_MAX_BYTES = env_int("FEI2HTML_SANITIZE_CACHE_MB", 64) << 20
+
+
+@lru_cache(maxsize=None)
+def _load_bleach():
+    # bleach pulls in html5lib; import it on first sanitize, not at startup
+    try:
+        import bleach  # type: ignore
+    except Exception:  # graceful fallback if bleach not installed
+        bleach = None
+    return bleach
 
 
 ALLOWED_TAGS = [
@@ -38,6 +63,7 @@ ALLOWED_TAGS = [
     "figcaption",
     "sup",
     "sub",
+    "div",
 ]
 
 ALLOWED_ATTRS = {
@@ -47,6 +73,7 @@ ALLOWED_ATTRS = {
     "th": ["colspan", "rowspan", "align"],
     "span": ["class"],
     "code": ["class"],
+    "div": ["class"],
     "p": ["class"],
     "pre": ["class"],
     "h1": ["id"],
@@ -58,7 +85,25 @@ ALLOWED_ATTRS = {
 }
 
 
-def sanitize_and_inject_css(html: str) -> str:
+_fast = AllowlistSanitizer(ALLOWED_TAGS, ALLOWED_ATTRS)
+_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def sanitize_and_inject_css(html: str, backend: Optional[str] = None) -> str:
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend not in ("fast", "bleach"):
+        raise ValueError(f"Unknown sanitizer backend: {backend}")
+    # Re-uploads of an unchanged document skip sanitizing entirely
+    key = (backend, hashlib.sha256(html.encode("utf-8", "surrogatepass")).digest())
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    bleach = _load_bleach() if backend == "bleach" else None
     if bleach:
         cleaned = bleach.clean(
             html,
@@ -68,9 +113,27 @@ def sanitize_and_inject_css(html: str) -> str:
         )
         cleaned = bleach.linkify(cleaned, callbacks=[_set_rel_noopener])
     else:
-        # Fallback: minimal cleanup by simple replacement (no security guarantees)
-        cleaned = html
-    return f'<div class="lark-article">{cleaned}</div>'
+        # Also used when bleach isn't installed
+        cleaned = _fast.clean(html)
+    result = f'<div class="lark-article">{cleaned}</div>'
+
+    _cache_put(key, result)
+    return result
+
+
+def _cache_put(key: tuple, result: str) -> None:
+    global _cache_bytes
+    size = sys.getsizeof(result)
+    if CACHE_SIZE <= 0 or size > CACHE_MAX_BYTES:
+        return
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= sys.getsizeof(old)
+        _cache[key] = result
+        _cache_bytes += size
+        while len(_cache) > CACHE_SIZE or _cache_bytes > CACHE_MAX_BYTES:
+            _cache_bytes -= sys.getsizeof(_cache.popitem(last=False)[1])
 
 
 def _set_rel_noopener(attrs, new=False):
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Tables with at least this many body rows are virtualized
+LARGE_TABLE_ROWS = 200
+# Body rows kept inline in the HTML for a virtualized table
+INLINE_TABLE_ROWS = 50
+
+_TABLE_TAG_RE = re.compile(r"<(/?)table\b[^>]*>", re.I)
+_STASH_RE = re.compile(r'<table data-stash="(\d+)"></table>')
+_TBODY_RE = re.compile(r"<tbody\b([^>]*)>(.*?)</tbody>", re.I | re.S)
+_TR_RE = re.compile(r"<tr\b([^>]*)>(.*?)</tr>", re.I | re.S)
+_CELL_RE = re.compile(r"<(t[hd])\b([^>]*)>(.*?)</t[hd]>", re.I | re.S)
+# What may separate the cut rows besides the rows themselves
+_ROW_GAP_RE = re.compile(r"(?:\s|</tbody>|<tbody\b[^>]*>)*", re.I)
+_VIRTUAL_RE = re.compile(r'<tr class="table-virtual" data-table-index="(\d+)"[^>]*></tr>')
+_LEGACY_VIRTUAL_RE = re.compile(r'</tbody></table><div class="table-virtual" data-table-index="(\d+)"[^>]*></div>')
+
+
+def iter_table_spans(html: str) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) offsets of top-level <table> elements.
+
+    Nested tables stay inside their parent's span.
+    """
+
+    depth = 0
+    start = 0
+    for m in _TABLE_TAG_RE.finditer(html):
+        if not m.group(1):
+            if depth == 0:
+                start = m.start()
+            depth += 1
+        elif depth:
+            depth -= 1
+            if depth == 0:
+                yield start, m.end()
+
+
+def stash_tables(html: str) -> Tuple[str, List[str]]:
+    """Replace each top-level table with an empty marker table.
+
+    Paragraph/heading passes then never scan table cells; the marker still
+    looks like a block-level <table> so open lists are closed around it.
+    """
+
+    tables: List[str] = []
+    out: List[str] = []
+    pos = 0
+    for start, end in iter_table_spans(html):
+        out.append(html[pos:start])
+        out.append(f'<table data-stash="{len(tables)}"></table>')
+        tables.append(html[start:end])
+        pos = end
+    if not tables:
+        return html, tables
+    out.append(html[pos:])
+    return "".join(out), tables
+
+
+def restore_tables(html: str, tables: List[str], transform: Callable[[str], str] = lambda t: t) -> str:
+    """Put stashed tables back, passing each through `transform`."""
+
+    if not tables:
+        return html
+    return _STASH_RE.sub(lambda m: transform(tables[int(m.group(1))]), html)
+
+
+def _encode_row(attrs: str, row_html: str, tbody: Optional[str] = None) -> List[Any]:
+    # Plain <td> cells are stored as their inner HTML; anything else as
+    # [tag, attrs, inner] so colspan/rowspan/th survive. A row with
+    # attributes, or one that opens a new <tbody>, starts with a
+    # {"attrs", "tbody"} object.
+    cells: List[Any] = []
+    meta: Dict[str, str] = {}
+    if attrs.strip():
+        meta["attrs"] = attrs.strip()
+    if tbody is not None:
+        meta["tbody"] = tbody.strip()
+    if meta:
+        cells.append(meta)
+    for tag, cell_attrs, inner in _CELL_RE.findall(row_html):
+        tag = tag.lower()
+        cell_attrs = cell_attrs.strip()
+        if tag == "td" and not cell_attrs:
+            cells.append(inner)
+        else:
+            cells.append([tag, cell_attrs, inner])
+    return cells
+
+
+def _virtualize_table(table_html: str, index: int, inline_rows: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Cut the body rows past `inline_rows`; everything else stays verbatim.
+
+    The placeholder row goes where the cut rows were. None if the table has
+    something other than rows between them (nothing is virtualized then).
+    """
+
+    # (tbody index, tbody attrs, row start, row end, tr attrs, row inner)
+    rows = []
+    for b, body in enumerate(_TBODY_RE.finditer(table_html)):
+        for m in _TR_RE.finditer(body.group(2)):
+            start = body.start(2) + m.start()
+            rows.append((b, body.group(1), start, start + len(m.group(0)), m.group(1), m.group(2)))
+    if len(rows) <= inline_rows:
+        return None
+    cut, tail = rows[inline_rows][2], rows[-1][3]
+    removed = table_html[cut:tail]
+    if not _ROW_GAP_RE.fullmatch(_TR_RE.sub("", removed)):
+        return None
+
+    encoded = []
+    prev_body = rows[inline_rows - 1][0] if inline_rows else rows[0][0]
+    for b, body_attrs, _, _, attrs, inner in rows[inline_rows:]:
+        encoded.append(_encode_row(attrs, inner, body_attrs if b != prev_body else None))
+        prev_body = b
+    placeholder = (
+        f'<tr class="table-virtual" data-table-index="{index}" '
+        f'data-total-rows="{len(rows)}" data-inline-rows="{inline_rows}"></tr>'
+    )
+    data = {
+        "index": index,
+        "total_rows": len(rows),
+        "inline_rows": inline_rows,
+        "rows": encoded,
+    }
+    return table_html[:cut] + placeholder + table_html[tail:], data
+
+
+def virtualize_large_tables(
+    html: str,
+    min_rows: int = LARGE_TABLE_ROWS,
+    inline_rows: int = INLINE_TABLE_ROWS,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Keep only the first rows of large tables inline.
+
+    Run on sanitized HTML. Each table with at least `min_rows` body rows is
+    cut to `inline_rows` rows followed by a `tr.table-virtual` placeholder;
+    the remaining rows are returned as compact JSON-ready row data, one
+    entry per virtualized table, for progressive rendering.
+    """
+
+    tables: List[Dict[str, Any]] = []
+    out: List[str] = []
+    pos = 0
+    for start, end in iter_table_spans(html):
+        table_html = html[start:end]
+        # Cheap pre-check before parsing; nested tables are left alone
+        if table_html.count("<tr") < min_rows or table_html.count("<table", 1) > 0:
+            continue
+        virtualized = _virtualize_table(table_html, len(tables), inline_rows)
+        if virtualized is None or virtualized[1]["total_rows"] < min_rows:
+            continue
+        new_html, data = virtualized
+        out.append(html[pos:start])
+        out.append(new_html)
+        tables.append(data)
+        pos = end
+    if not tables:
+        return html, tables
+    out.append(html[pos:])
+    return "".join(out), tables
+
+
+def _decode_row(cells: List[Any]) -> str:
+    out = []
+    meta = cells[0] if cells and isinstance(cells[0], dict) else {}
+    if meta:
+        cells = cells[1:]
+    for c in cells:
+        if isinstance(c, str):
+            out.append(f"<td>{c}</td>")
+        else:
+            tag, attrs, inner = c
+            out.append(f"<{tag}{' ' + attrs if attrs else ''}>{inner}</{tag}>")
+    attrs = meta.get("attrs")
+    row = f"<tr{' ' + attrs if attrs else ''}>{''.join(out)}</tr>"
+    if "tbody" in meta:
+        row = f"</tbody><tbody{' ' + meta['tbody'] if meta['tbody'] else ''}>{row}"
+    return row
+
+
+def expand_virtual_tables(html: str, tables: List[Dict[str, Any]]) -> str:
+    """Inverse of `virtualize_large_tables`: put the stored rows back inline.
+
+    Placeholders without row data are left as they are. Documents stored
+    before the placeholder became a row (`div.table-virtual` after the
+    table) are expanded too.
+    """
+
+    if not tables:
+        return html
+    by_index = {t["index"]: t for t in tables}
+
+    def rows(m: "re.Match[str]") -> Optional[str]:
+        table = by_index.get(int(m.group(1)))
+        if table is None:
+            return None
+        return "".join(_decode_row(r) for r in table["rows"])
+
+    def repl(m: "re.Match[str]") -> str:
+        restored = rows(m)
+        return m.group(0) if restored is None else restored
+
+    def repl_legacy(m: "re.Match[str]") -> str:
+        restored = rows(m)
+        return m.group(0) if restored is None else restored + "</tbody></table>"
+
+    html = _VIRTUAL_RE.sub(repl, html)
+    return _LEGACY_VIRTUAL_RE.sub(repl_legacy, html)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Fill the `assets` table for documents stored before it existed.
+
+Reads each document's legacy `asset_manifest` JSON column and, when the file
+is still under public/assets, adds digest/size/mime/dimensions.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+# Ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import insert
+
+from app.db import SessionLocal, init_db
+from app.models import Asset, Document
+from app.services.image_meta import describe_asset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the assets table from legacy asset_manifest JSON")
+    parser.add_argument("--assets-dir", type=str, default="public/assets", help="Local directory served as /assets")
+    parser.add_argument("--base-url", type=str, default="/assets", help="URL prefix of --assets-dir")
+    args = parser.parse_args()
+
+    init_db()
+    assets_dir = Path(args.assets_dir)
+    base_url = args.base_url.rstrip("/") + "/"
+    filled = 0
+    with SessionLocal() as db, db.begin():
+        have_rows = {r[0] for r in db.query(Asset.document_id).distinct()}
+        for doc in db.query(Document).filter(Document.asset_manifest.isnot(None)):
+            if doc.id in have_rows or not doc.asset_manifest:
+                continue
+            rows = []
+            for item in doc.asset_manifest:
+                # Same keys on every row so the bulk INSERT keeps all columns
+                row = {
+                    "document_id": doc.id,
+                    "doc_id": doc.doc_id,
+                    "name": item["name"],
+                    "url": item["url"],
+                    "digest": None,
+                    "size": None,
+                    "mime": None,
+                    "width": None,
+                    "height": None,
+                }
+                if item["url"].startswith(base_url):
+                    local = assets_dir / item["url"][len(base_url):]
+                    if local.is_file():
+                        row.update(describe_asset(local))
+                rows.append(row)
+            db.execute(insert(Asset), rows)
+            filled += 1
+    print(f"Backfilled assets for {filled} document(s)")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the HTML post-processing stages on synthetic input."""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.services.html_postprocess import add_heading_ids, paragraphs_to_lists, process_all
+from app.services.sanitizer import sanitize_and_inject_css
+from app.services.tables import virtualize_large_tables
+
+
+def table_heavy_html(tables: int, rows: int) -> str:
+    parts = []
+    for t in range(tables):
+        parts.append(f"<p><strong>{t + 1} 表格</strong></p><p>• 说明一</p><p>• 说明二</p>")
+        body = "".join(
+            f"<tr><td><p>• 行 {r}</p></td><td><p><strong>值 {r}</strong></p><p>1. 备注</p></td></tr>"
+            for r in range(rows)
+        )
+        parts.append(f"<table><thead><tr><th>名称</th><th>说明</th></tr></thead><tbody>{body}</tbody></table>")
+    return "".join(parts)
+
+
+def paragraph_heavy_html(paragraphs: int) -> str:
+    # Mix of plain text, bullets, numbered items and repeated headings
+    kinds = [
+        "<p>普通段落，包含 <em>强调</em> 与 <a href=\"https://example.com\">链接</a>。</p>",
+        "<p>• 项目符号条目</p>",
+        "<p>• 另一条目</p>",
+        "<p>1. 编号条目</p>",
+        "<p>2) 编号条目</p>",
+        "<p>（一） 中文编号</p>",
+        "<p><strong>重复标题</strong></p>",
+        "<p>- 短横线条目</p>",
+    ]
+    return "".join(kinds[i % len(kinds)] for i in range(paragraphs))
+
+
+# Baseline: the implementations these stages replaced, kept verbatim so the
+# speedup and output equality are measured, not assumed.
+
+def _baseline_slugify(text: str) -> str:
+    s = re.sub(r"\s+", "-", text.strip())
+    s = re.sub(r"[^\w\-\u4e00-\u9fff]+", "", s, flags=re.UNICODE)
+    return s[:80] or "section"
+
+
+def baseline_add_heading_ids(html: str) -> str:
+    # For any h1-h6 without id, generate one from text
+    def repl(m: re.Match) -> str:
+        tag = m.group(1)
+        attrs = m.group(2)
+        inner = m.group(3)
+        if re.search(r"\bid=\"", attrs, re.I):
+            return m.group(0)
+        hid = _baseline_slugify(re.sub(r"<[^>]+>", "", inner))
+        return f"<{tag} id=\"{hid}\"{attrs}>{inner}</{tag}>"
+
+    pattern = re.compile(r"<(h[1-6])(\b[^>]*)>(.*?)</h[1-6]>", re.I | re.S)
+    return pattern.sub(repl, html)
+
+
+def baseline_paragraphs_to_lists(html: str) -> str:
+    """
+    将连续“项目符号/编号”的段落 <p>... 转为 <ul>/<ol><li>...</li>。
+    - 仅在出现连续 >=2 个同类条目时才触发（降低误判）。
+    - 简单排除：在 <table>...</table> 内不处理。
+    支持的前缀：
+      • ● ○ ◦ · 以及 "- ", "* ";
+      数字/中文数字 + . 或 、 或 ) 或 ）：如 "1. ", "1) ", "1、", "（一）"、"(1)"。
+    """
+    # Tokenize by <p>...</p> boundaries (retain delimiters)
+    parts = re.split(r"(<p\b[^>]*>.*?</p>)", html, flags=re.I | re.S)
+    out = []
+    i = 0
+    in_table = 0
+    in_list = False
+    list_type = None  # 'ul' or 'ol'
+
+    def classify(text: str):
+        t = re.sub(r"<[^>]+>", "", text).strip()
+        # Bullet symbols
+        if re.match(r"^(•|●|○|◦|·)\s+", t):
+            return 'ul', re.sub(r"^(•|●|○|◦|·)\s+", "", t)
+        if re.match(r"^(-|\*)\s+", t):
+            return 'ul', re.sub(r"^(-|\*)\s+", "", t)
+        # Numbered (Arabic or Chinese numerals)
+        if re.match(r"^\d+[\.、\)]\s+", t):
+            return 'ol', re.sub(r"^\d+[\.、\)]\s+", "", t)
+        if re.match(r"^[\(（](\d+|[一二三四五六七八九十]+)[\)）]\s+", t):
+            return 'ol', re.sub(r"^[\(（](\d+|[一二三四五六七八九十]+)[\)）]\s+", "", t)
+        if re.match(r"^[一二三四五六七八九十]+[、]\s+", t):
+            return 'ol', re.sub(r"^[一二三四五六七八九十]+[、]\s+", "", t)
+        return None, None
+
+    while i < len(parts):
+        seg = parts[i]
+        # Track table enter/exit
+        if re.search(r"<table\b", seg, flags=re.I):
+            in_table += 1
+        if re.search(r"</table>", seg, flags=re.I):
+            in_table = max(0, in_table - 1)
+
+        m = re.match(r"^<p\b[^>]*>(.*?)</p>$", seg, flags=re.I | re.S)
+        if not m:
+            # Non-paragraph segment
+            # Close any open list before emitting a block element that is not <p>
+            if in_list and re.search(r"<(?:div|h[1-6]|table|ul|ol|blockquote|pre)\b", seg, flags=re.I):
+                out.append(f"</{list_type}>")
+                in_list = False
+                list_type = None
+            out.append(seg)
+            i += 1
+            continue
+
+        inner = m.group(1)
+        if in_table > 0:
+            # Don't convert inside table cells
+            if in_list:
+                out.append(f"</{list_type}>")
+                in_list = False
+                list_type = None
+            out.append(seg)
+            i += 1
+            continue
+
+        kind, item_text = classify(inner)
+        if not kind:
+            # Close list if open
+            if in_list:
+                out.append(f"</{list_type}>")
+                in_list = False
+                list_type = None
+            out.append(seg)
+            i += 1
+            continue
+
+        # Lookahead to ensure at least 2 consecutive items of same type
+        if not in_list:
+            # Peek next paragraph
+            next_is_same = False
+            if i + 2 < len(parts):
+                m2 = re.match(r"^<p\b[^>]*>(.*?)</p>$", parts[i+2], flags=re.I | re.S)
+                if m2:
+                    k2, _ = classify(m2.group(1))
+                    next_is_same = (k2 == kind)
+            if not next_is_same:
+                # Not enough to be a list; keep as-is
+                out.append(seg)
+                i += 1
+                continue
+            # Open list
+            out.append(f"<{kind}>")
+            in_list = True
+            list_type = kind
+
+        # Append item
+        out.append(f"<li>{item_text}</li>")
+        i += 1
+
+        # If next paragraph is not same kind, close list in next loop iteration
+        # (Handled at top when non-list paragraph encountered.)
+
+    # Close any dangling list
+    if in_list:
+        out.append(f"</{list_type}>")
+    return "".join(out)
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - started) * 1000
+
+
+def bench_tables(tables: int, rows: int) -> None:
+    html = table_heavy_html(tables, rows)
+    processed, t_post = _timed(process_all, html)
+    cleaned, t_clean = _timed(sanitize_and_inject_css, processed)
+    (virtual, data), t_virt = _timed(virtualize_large_tables, cleaned)
+    print(f"tables: {tables} x {rows} rows, input {len(html) / 1024:.0f} KiB")
+    print(f"  process_all          {t_post:8.1f} ms")
+    print(f"  sanitize             {t_clean:8.1f} ms")
+    print(f"  virtualize           {t_virt:8.1f} ms  ({len(data)} tables virtualized)")
+    print(f"  page weight          {len(cleaned.encode()) / 1024:8.0f} KiB -> {len(virtual.encode()) / 1024:.0f} KiB inline")
+
+
+def _best(repeat: int, fn, *args):
+    runs = [_timed(fn, *args) for _ in range(max(1, repeat))]
+    return runs[0][0], min(t for _, t in runs)
+
+
+def bench_paragraphs(paragraphs: int, repeat: int) -> bool:
+    """Current vs baseline list and heading-id passes; False if outputs differ."""
+
+    html = paragraph_heavy_html(paragraphs)
+    headings = "".join(f"<h3>重复标题 {i % 50}</h3>" for i in range(paragraphs // 10))
+    lists, t_lists = _best(repeat, paragraphs_to_lists, html)
+    old_lists, t_old_lists = _best(repeat, baseline_paragraphs_to_lists, html)
+    ids, t_ids = _best(repeat, add_heading_ids, headings)
+    old_ids, t_old_ids = _best(repeat, baseline_add_heading_ids, headings)
+    _, t_dedup = _best(repeat, lambda h: add_heading_ids(h, {}), headings)
+    _, t_post = _best(repeat, process_all, html)
+    same_lists, same_ids = lists == old_lists, ids == old_ids
+    print(f"paragraphs: {paragraphs}, input {len(html) / 1024:.0f} KiB (best of {max(1, repeat)})")
+    print(f"{'':23}{'baseline':>11}{'current':>11}{'speedup':>10}  output")
+    print(
+        f"  paragraphs_to_lists  {t_old_lists:8.1f} ms {t_lists:7.1f} ms {t_old_lists / t_lists:7.1f} x"
+        f"  {'same' if same_lists else 'DIFFERENT'}"
+    )
+    print(
+        f"  add_heading_ids      {t_old_ids:8.1f} ms {t_ids:7.1f} ms {t_old_ids / t_ids:7.1f} x"
+        f"  {'same' if same_ids else 'DIFFERENT'}  ({paragraphs // 10} headings)"
+    )
+    print(f"  add_heading_ids, deduplicated ids   {t_dedup:7.1f} ms")
+    print(f"  process_all                         {t_post:7.1f} ms")
+    return same_lists and same_ids
+
+
+def bench_sanitize(tables: int, rows: int, paragraphs: int) -> None:
+    # Converter-shaped input: post-processed paragraphs, lists, links and tables
+    html = process_all(paragraph_heavy_html(paragraphs) + table_heavy_html(tables, rows))
+    mib = len(html.encode()) / (1 << 20)
+    print(f"sanitize: input {mib * 1024:.0f} KiB")
+    results = {}
+    for backend in ("bleach", "fast"):
+        out, elapsed = _timed(sanitize_and_inject_css, html, backend)
+        results[backend] = elapsed
+        print(f"  {backend:<20} {elapsed:8.1f} ms  ({mib / (elapsed / 1000):.1f} MiB/s, {len(out) / 1024:.0f} KiB out)")
+    _, hit = _timed(sanitize_and_inject_css, html)
+    print(f"  speedup              {results['bleach'] / results['fast']:8.1f} x")
+    print(f"  cached re-upload     {hit:8.1f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark HTML post-processing")
+    parser.add_argument("--tables", type=int, default=20, help="Number of tables in the table-heavy document")
+    parser.add_argument("--rows", type=int, default=500, help="Body rows per table")
+    parser.add_argument("--paragraphs", type=int, default=50000, help="Paragraphs in the list/heading benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per list/heading measurement; the fastest counts")
+    args = parser.parse_args()
+    bench_tables(args.tables, args.rows)
+    ok = bench_paragraphs(args.paragraphs, args.repeat)
+    bench_sanitize(args.tables, args.rows, args.paragraphs // 5)
+    if not ok:
+        print("current output differs from the baseline", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Import-time benchmark and regression check for the service entrypoint.
+
+Runs `import app.main` in fresh interpreters, reports the median wall time and
+the slowest modules from `python -X importtime`, and fails when either budget
+(total wall time, self time of the `app.*` modules) is exceeded or when a
+module that must stay lazy shows up at import.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Modules that should only load on first use (sanitize / DB connect / convert)
+LAZY_MODULES = [
+    "bleach",
+    "html5lib",
+    "pymysql",
+    "sqlalchemy.dialects.sqlite.pysqlite",
+    "sqlalchemy.dialects.postgresql",
+    "sqlalchemy.dialects.mysql",
+]
+
+_WALL_SNIPPET = (
+    "import time, sys; t = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - t) * 1000); "
+    "print(','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    return subprocess.run(args, cwd=ROOT, capture_output=True, text=True, env=env)
+
+
+def measure_wall(module: str, runs: int) -> Tuple[List[float], List[str]]:
+    samples: List[float] = []
+    loaded: List[str] = []
+    snippet = _WALL_SNIPPET.format(module=module, lazy=LAZY_MODULES)
+    for _ in range(runs):
+        proc = _run([sys.executable, "-c", snippet])
+        if proc.returncode != 0:
+            raise SystemExit(proc.stderr)
+        lines = proc.stdout.splitlines()
+        samples.append(float(lines[0]))
+        loaded = [m for m in lines[1].split(",") if m] if len(lines) > 1 else []
+    return samples, loaded
+
+
+def measure_importtime(module: str) -> Dict[str, Tuple[int, int]]:
+    """Return {module: (self_us, cumulative_us)} from `-X importtime`."""
+
+    proc = _run([sys.executable, "-X", "importtime", "-c", f"import {module}"])
+    stats: Dict[str, Tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[13:]:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|")
+            stats[name.strip()] = (int(self_us), int(cum_us))
+        except ValueError:
+            continue  # header line
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the API entrypoint")
+    parser.add_argument("--module", default="app.main", help="Module to import (default: app.main)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreter runs for the wall-time median")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Fail if the median exceeds this")
+    parser.add_argument(
+        "--app-budget-ms",
+        type=float,
+        default=120.0,
+        help="Fail if the median self time of app.* modules (from -X importtime) exceeds this",
+    )
+    parser.add_argument("--top", type=int, default=15, help="Show the N slowest modules by cumulative time")
+    args = parser.parse_args()
+
+    samples, loaded = measure_wall(args.module, args.runs)
+    median = statistics.median(samples)
+    app_samples = []
+    for _ in range(max(1, args.runs)):
+        stats = measure_importtime(args.module)
+        app_samples.append(sum(s for name, (s, _) in stats.items() if name == "app" or name.startswith("app.")) / 1000)
+    app_self = statistics.median(app_samples)
+
+    print(f"import {args.module}: median {median:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"app.* self time: median {app_self:.1f} ms (budget {args.app_budget_ms:.0f} ms)")
+    print("slowest modules (cumulative ms):")
+    for name, (_, cum) in sorted(stats.items(), key=lambda kv: kv[1][1], reverse=True)[: args.top]:
+        print(f"  {cum / 1000:8.1f}  {name}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: loaded at import, should be lazy: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: median {median:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    if app_self > args.app_budget_ms:
+        print(f"FAIL: app.* self time {app_self:.1f} ms exceeds budget {args.app_budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
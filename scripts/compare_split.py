@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Convert documents whole and split into parts, and compare the HTML.
+
+Splitting (CONVERT_SPLIT_XML_MB) is opt-in; run this over real documents
+before enabling it. Exits 1 if any document's split output differs.
+
+With `--baseline html` this is also the parity check between the two
+pipelines. Markup is compared as parsed (attribute order, "/>" and
+whitespace between tags don't count). The one expected difference is that
+the AST pipeline promotes some strong-only paragraphs that the html
+pipeline's regex misses.
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import sys
+import tempfile
+from dataclasses import replace
+from html import escape
+from html.parser import HTMLParser
+from pathlib import Path
+
+# Ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.converters.hybrid import HybridConverter
+from app.services.image_store import LocalImageStore
+
+
+class _Lines(HTMLParser):
+    """One line per tag or text run, so diffs point at the element that differs."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: list = []
+
+    def handle_starttag(self, tag, attrs):
+        self.lines.append(f"<{tag}" + "".join(f' {k}="{escape(v or "")}"' for k, v in sorted(attrs)) + ">")
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        self.lines.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if data.strip():
+            self.lines.extend(data.splitlines())
+
+
+def _lines(html: str) -> list:
+    parser = _Lines()
+    parser.feed(html)
+    parser.close()
+    return parser.lines
+
+
+def compare(docx_path: Path, parts: int, baseline: str, context: int) -> int:
+    """0 if identical, 1 if different, 2 if the document can't be split."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = LocalImageStore(base_dir=Path(tmpdir), base_url="/assets")
+        whole_conv = HybridConverter(image_store=store, pipeline=baseline)
+        split_conv = HybridConverter(image_store=store, pipeline="ast")
+        whole_plan = replace(whole_conv.plan(docx_path), offsets=[], workers=1)
+        split_plan = replace(whole_plan, pipeline="ast", offsets=whole_plan.inspection.split_offsets(parts))
+        if not split_plan.offsets:
+            print(f"{docx_path}: no top-level headings to split at")
+            return 2
+        split_plan = replace(split_plan, workers=split_plan.parts)
+        whole = whole_conv.convert_docx(docx_path, doc_id="doc", plan=whole_plan).html
+        split = split_conv.convert_docx(docx_path, doc_id="doc", plan=split_plan).html
+
+    if whole == split:
+        print(f"{docx_path}: identical ({split_plan.parts} parts vs whole {baseline})")
+        return 0
+    whole_lines, split_lines = _lines(whole), _lines(split)
+    if whole_lines == split_lines:
+        print(f"{docx_path}: equivalent ({split_plan.parts} parts vs whole {baseline}; serialization differs only)")
+        return 0
+    diff = list(difflib.unified_diff(whole_lines, split_lines, "whole", "split", n=context, lineterm=""))
+    changed = sum(1 for line in diff if line[:1] in "+-" and line[:3] not in ("+++", "---"))
+    print(f"{docx_path}: DIFFERENT ({split_plan.parts} parts vs whole {baseline}, {changed} lines changed)")
+    for line in diff[:200]:
+        print(f"  {line}")
+    if len(diff) > 200:
+        print(f"  ... {len(diff) - 200} more diff lines")
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare split and whole-document conversion output")
+    parser.add_argument("docx", nargs="+", help="Paths to .docx files")
+    parser.add_argument("--parts", type=int, default=2, help="Parts to split each document into (default: 2)")
+    parser.add_argument(
+        "--baseline",
+        choices=["ast", "html"],
+        default="ast",
+        help="Whole-document pipeline to compare against: ast isolates the effect of splitting, html is the default output",
+    )
+    parser.add_argument("--context", type=int, default=2, help="Diff context lines")
+    args = parser.parse_args()
+
+    status = 0
+    for name in args.docx:
+        path = Path(name)
+        if not path.exists():
+            print(f"File not found: {path}", file=sys.stderr)
+            return 2
+        status = max(status, compare(path, max(2, args.parts), args.baseline, args.context))
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,6 +4,7 @@ from __future__ import annotations
 import argparse
 import json
 import sys
+from dataclasses import asdict
 from pathlib import Path
 
 # Ensure project root on sys.path
@@ -12,8 +13,10 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from app.converters.hybrid import HybridConverter
+from app.services.export import EXPORT_FORMATS, ExportSource, stream_export
 from app.services.image_store import LocalImageStore
 from app.services.sanitizer import sanitize_and_inject_css
+from app.services.tables import virtualize_large_tables
 
 
 def main():
@@ -21,6 +24,25 @@ def main():
     parser.add_argument("docx", type=str, help="Path to .docx file")
     parser.add_argument("--doc-id", type=str, default=None, help="Logical doc id for asset naming")
     parser.add_argument("--out-html", type=str, default=None, help="Output html path (defaults next to docx)")
+    parser.add_argument(
+        "--pipeline",
+        choices=["html", "ast", "auto"],
+        default=None,
+        help="Pandoc HTML + regex post-processing, Pandoc JSON AST passes, or chosen per document (default: $FEI2HTML_PIPELINE or html)",
+    )
+    parser.add_argument("--inspect", action="store_true", help="Print the inspection and conversion plan as JSON, don't convert")
+    parser.add_argument(
+        "--export",
+        choices=EXPORT_FORMATS,
+        default=None,
+        help="Also write a portable copy: <out>.zip with the assets, or <out>.standalone.html with small images inlined",
+    )
+    parser.add_argument(
+        "--virtualize-tables",
+        action="store_true",
+        help="Cut large tables to their first rows (as the service stores them) and write the rest to <out>.tables.json",
+    )
+    parser.add_argument("--inline-max-kb", type=int, default=None, help="Largest image inlined by --export html (default: $EXPORT_INLINE_MAX_KB or 64)")
     args = parser.parse_args()
 
     docx_path = Path(args.docx)
@@ -29,10 +51,21 @@ def main():
         return 2
 
     image_store = LocalImageStore(base_dir=Path("public/assets"), base_url="/assets")
-    converter = HybridConverter(image_store=image_store)
+    converter = HybridConverter(image_store=image_store, pipeline=args.pipeline)
+    plan = converter.plan(docx_path)
+    if args.inspect:
+        info = asdict(plan.inspection)
+        info.pop("section_starts")
+        info["link_anchors"] = len(info["link_anchors"])
+        info["plan"] = {"pipeline": plan.pipeline, "parts": plan.parts, "workers": plan.workers, "memory_mb": plan.memory_mb}
+        print(json.dumps(info, ensure_ascii=False, indent=2))
+        return 0
 
-    result = converter.convert_docx(docx_path, doc_id=args.doc_id)
+    result = converter.convert_docx(docx_path, doc_id=args.doc_id, plan=plan)
     html_clean = sanitize_and_inject_css(result.html)
+    tables = []
+    if args.virtualize_tables:
+        html_clean, tables = virtualize_large_tables(html_clean)
 
     out_html = Path(args.out_html) if args.out_html else docx_path.with_suffix(".html")
     out_html.parent.mkdir(parents=True, exist_ok=True)
@@ -41,6 +74,20 @@ def main():
     manifest_path = out_html.with_suffix(".assets.json")
     manifest_path.write_text(json.dumps({"engine": result.engine, "assets": result.assets}, ensure_ascii=False, indent=2), encoding="utf-8")
 
+    if tables:
+        tables_path = out_html.with_suffix(".tables.json")
+        tables_path.write_text(json.dumps(tables, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        print(f"Virtualized tables: {tables_path}")
+
+    if args.export:
+        logical_id = args.doc_id or docx_path.stem
+        src = ExportSource(doc_id=logical_id, title=logical_id, html=html_clean, tables=tables, assets=result.assets)
+        export_path = out_html.with_suffix(".zip" if args.export == "zip" else ".standalone.html")
+        with export_path.open("wb") as f:
+            for chunk in stream_export(src, args.export, args.inline_max_kb):
+                f.write(chunk)
+        print(f"Export: {export_path}")
+
     print(f"Converted: {docx_path}")
     print(f"HTML: {out_html}")
     print(f"Assets manifest: {manifest_path}")
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Differential fuzz test: fast sanitizer vs bleach.
+
+Two kinds of random input:
+
+- "parity": well-nested markup shaped like converter output (plus
+  disallowed tags/attributes, hostile URLs, entities, control characters).
+  Both backends must produce the same start tags, attributes and text.
+- "hostile": unbalanced tags, raw-text elements, comments, broken attribute
+  syntax. The backends may structure the output differently here, so only
+  the security invariants are checked on the fast output: allowlisted tags
+  and attributes only, href/src accepted by bleach's own URI check, no
+  comments/declarations, balanced tags.
+
+Exits non-zero on the first failures found.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+from html import escape
+from html.parser import HTMLParser
+from pathlib import Path
+
+# Ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bleach.sanitizer import BleachSanitizerFilter
+
+from app.services.fast_sanitizer import ALLOWED_PROTOCOLS
+from app.services.sanitizer import ALLOWED_ATTRS, ALLOWED_TAGS, sanitize_and_inject_css
+
+
+WORDS = ["文档", "飞书", "Hello", "world", "a < b", "x > y", "R&D", "AT&T", "  ", "\n", "\t", "句号。", "(括号)"]
+# bleach re-escapes "<" and "&" inside attribute values of linkified output;
+# those only appear in hostile input
+ATTR_WORDS = ["文档", "Hello world", "x > y", "  ", "\n", "\t", "(括号)", "1", "left", "lazy", "a b"]
+URLS = [
+    "www.example.com", "http://a.io/x?y=1&z=2", "https://example.org/path.", "(http://b.com)",
+    "example.cn,", "mailto:me@example.com", "https://例子.测试/a",
+    "http://example.com:8080/a_(b)", "foo.bar", "v1.2.3", "docs.python.org/3/library/",
+]
+# bleach.linkify links these too; the fast sanitizer leaves them as text
+OTHER_SCHEME_URLS = ["ftp://files.example.net", "feed://example.com/rss", "data://example.com/x", "irc://irc.example.org"]
+ENTITIES = ["&amp;", "&lt;", "&gt;", "&nbsp;", "&copy;", "&#169;", "&#x4e2d;", "&quot;", "&", "&unknown;"]
+# Without ";" browsers (and html.parser) decode these, bleach keeps them literal
+LOOSE_ENTITIES = ["&amp", "&copy", "&lt"]
+CONTROLS = ["\x01", "\x07", "\x0b", "\x1f", "\x7f", "\x00", "\r\n"]
+URI_VALUES = [
+    "/assets/doc/image1.png", "image.png", "#section-1", "//cdn.example.com/x.png", "?q=1",
+    "http://example.com", "HTTPS://EXAMPLE.COM/A", "mailto:a@b.c", "javascript:alert(1)",
+    "JaVaScRiPt:alert(1)", " javascript:alert(1)", "java\tscript:alert(1)", "java\nscript:x",
+    "&#106;avascript:alert(1)", "&#x6A;avascript:alert(1)",
+    "java&amp;#x73;cript:x", "vbscript:msgbox(1)", "data:text/html,<script>alert(1)</script>",
+    "data:image/png;base64,AAAA", "\x01javascript:alert(1)", "jav&#x09;ascript:alert(1)",
+    "feed:javascript:alert(1)", "http:/x", "mailto:",
+]
+# Dropped by the fast sanitizer, kept (harmlessly) by bleach: it doesn't
+# decode "&colon;", and its vendored urlparse reads "name:digits" as a path
+STRICTER_URIS = ["javascript&colon;alert(1)", "localhost:8080", "tel:123"]
+EXTRA_ATTRS = [
+    ("onclick", "alert(1)"), ("onerror", "alert(1)"), ("style", "color:red;background:url(javascript:x)"),
+    ("id", "x"), ("class", "c1 c2"), ("title", 'say "hi"'), ("data-x", "1"), ("xmlns", "x"),
+]
+INLINE_ALLOWED = ["strong", "em", "u", "s", "span", "code", "sup", "sub", "a"]
+INLINE_DENIED = ["b", "i", "font", "mark", "small", "abbr", "label", "kbd"]
+BLOCK_DENIED = ["section", "article", "header", "nav", "center", "aside", "main"]
+HOSTILE_TAGS = [
+    "script", "style", "iframe", "object", "embed", "svg", "math", "form", "input", "textarea",
+    "title", "xmp", "noscript", "noembed", "plaintext", "template", "base", "meta", "link", "frameset",
+]
+
+
+def _attr(name: str, value: str, rnd: random.Random) -> str:
+    quote = rnd.choice(['"', "'", ""]) if rnd.random() < 0.2 else '"'
+    if quote == '"':
+        value = value.replace('"', "&quot;")
+    elif quote == "'":
+        value = value.replace("'", "&#39;")
+    elif any(c in value for c in " \t\n\"'=<>`") or not value:
+        quote, value = '"', value.replace('"', "&quot;")
+    return f" {name}={quote}{value}{quote}"
+
+
+def _attrs(tag: str, rnd: random.Random) -> str:
+    out = []
+    names = list(ALLOWED_ATTRS.get(tag, []))
+    for _ in range(rnd.randint(0, 3)):
+        roll = rnd.random()
+        if names and roll < 0.5:
+            name = rnd.choice(names)
+            value = rnd.choice(URI_VALUES) if name in ("href", "src") else rnd.choice(ATTR_WORDS)
+        else:
+            name, value = rnd.choice(EXTRA_ATTRS)
+        out.append(_attr(name, value, rnd))
+    return "".join(out)
+
+
+def _text(rnd: random.Random, urls: bool = True) -> str:
+    parts = []
+    for _ in range(rnd.randint(1, 4)):
+        roll = rnd.random()
+        if urls and roll < 0.25:
+            # bleach linkifies across entities next to a URL; keep both delimited
+            parts.append(rnd.choice(URLS) + " ")
+        elif roll < 0.4:
+            parts.append(rnd.choice(ENTITIES) + " ")
+        elif roll < 0.45:
+            parts.append(rnd.choice(CONTROLS))
+        else:
+            parts.append(escape(rnd.choice(WORDS), quote=False))
+        parts.append(rnd.choice([" ", "", "，"]))
+    return "".join(parts)
+
+
+def _inline(rnd: random.Random, depth: int, in_a: bool = False) -> str:
+    out = []
+    for _ in range(rnd.randint(1, 3)):
+        roll = rnd.random()
+        if depth <= 0 or roll < 0.45:
+            out.append(_text(rnd))
+            continue
+        if roll < 0.5:
+            out.append(f"<br{_attrs('br', rnd)}>" if rnd.random() < 0.5 else "<br/>")
+        elif roll < 0.55:
+            out.append(f"<img{_attrs('img', rnd)}>")
+        elif roll < 0.6:
+            # Raw text for html5lib: entities inside stay literal there
+            out.append(f"<script>{rnd.choice(ATTR_WORDS)}</script>")
+        elif roll < 0.65:
+            out.append(f"<!-- {_text(rnd, urls=False).replace('-', '')} -->")
+        else:
+            tag = rnd.choice(INLINE_ALLOWED + INLINE_DENIED)
+            if tag == "a" and in_a:
+                tag = "span"
+            inner = _inline(rnd, depth - 1, in_a or tag == "a")
+            out.append(f"<{tag}{_attrs(tag, rnd)}>{inner}</{tag}>")
+    return "".join(out)
+
+
+def _block(rnd: random.Random, depth: int) -> str:
+    roll = rnd.random()
+    if depth <= 0 or roll < 0.35:
+        tag = rnd.choice(["p", "p", "h1", "h2", "h3", "pre", "figcaption"])
+        return f"<{tag}{_attrs(tag, rnd)}>{_inline(rnd, 2)}</{tag}>"
+    if roll < 0.5:
+        tag = rnd.choice(["ul", "ol"])
+        items = "".join(f"<li>{_flow(rnd, depth - 1)}</li>" for _ in range(rnd.randint(1, 3)))
+        return f"<{tag}>{items}</{tag}>"
+    if roll < 0.6:
+        cols = rnd.randint(1, 3)
+        head = "".join(f"<th{_attrs('th', rnd)}>{_inline(rnd, 1)}</th>" for _ in range(cols))
+        rows = "".join(
+            "<tr>" + "".join(f"<td{_attrs('td', rnd)}>{_flow(rnd, depth - 1)}</td>" for _ in range(cols)) + "</tr>"
+            for _ in range(rnd.randint(1, 3))
+        )
+        return f"<table><thead><tr>{head}</tr></thead><tbody>{rows}</tbody></table>"
+    tag = rnd.choice(["div", "blockquote", "figure"] + BLOCK_DENIED)
+    return f"<{tag}{_attrs(tag, rnd)}>{_flow(rnd, depth - 1)}</{tag}>"
+
+
+def _flow(rnd: random.Random, depth: int) -> str:
+    return "".join(_block(rnd, depth) for _ in range(rnd.randint(1, 3)))
+
+
+def parity_doc(rnd: random.Random) -> str:
+    return _flow(rnd, 2)
+
+
+def hostile_doc(rnd: random.Random) -> str:
+    pieces = []
+    for _ in range(rnd.randint(3, 25)):
+        roll = rnd.random()
+        if roll < 0.3:
+            tag = rnd.choice(ALLOWED_TAGS + HOSTILE_TAGS + INLINE_DENIED)
+            pieces.append(f"<{tag}{_attrs(tag, rnd)}{rnd.choice(['', '/', ' /'])}>")
+        elif roll < 0.5:
+            pieces.append(f"</{rnd.choice(ALLOWED_TAGS + HOSTILE_TAGS)}>")
+        elif roll < 0.6:
+            pieces.append(rnd.choice([
+                "<!--", "-->", "<!-- x -- y -->", "<!DOCTYPE html>", "<![CDATA[<b>x</b>]]>", "<?php echo 1 ?>",
+                "<a href=javascript:alert(1)>", '<a title="x &amp y">',
+                '<a title="say &quot;hi&quot; & <bye>">', "<a href='x' href='javascript:y'>", '<img src="x" src=javascript:1>',
+                "<a\thref=x>", "<a/href=x>", "<img src=x onerror=alert(1)//", "<<p>>", "</ p>", "<p <b>",
+                "<a href=\"http://x\"<script>", "</div></div></div>", "<sCrIpT>alert(1)</ScRiPt>",
+                "<svg><script>alert(1)</script></svg>", "<math><mtext><table><mglyph><style><img src=x>",
+                "<noscript><p title=\"</noscript><img src=x onerror=alert(1)>\">", "<div class=\"lark-article\">",
+            ]))
+        elif roll < 0.65:
+            pieces.append(rnd.choice(OTHER_SCHEME_URLS + LOOSE_ENTITIES))
+        elif roll < 0.7:
+            pieces.append(f'<a{_attr("href", rnd.choice(STRICTER_URIS), rnd)}>')
+        else:
+            pieces.append(_text(rnd) if rnd.random() < 0.5 else _inline(rnd, 2))
+    return "".join(pieces)
+
+
+class _Events(HTMLParser):
+    """Start tags with attributes and merged text; end tags ignored."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.events = []
+        self.other = []
+        self.depth_errors = 0
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        self.events.append(("start", tag, tuple(sorted((k, v or "") for k, v in attrs))))
+        if tag not in ("br", "img"):
+            self.stack.append(tag)
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack[-1] != tag:
+            self.depth_errors += 1
+        else:
+            self.stack.pop()
+
+    def handle_data(self, data):
+        # Browser-equivalent differences: CR normalization and the newline
+        # right after <pre>, which html5lib drops and browsers ignore
+        data = data.replace("\r\n", "\n").replace("\r", "\n")
+        if self.events and self.events[-1][:2] == ("start", "pre") and data.startswith("\n"):
+            data = data[1:]
+        if not data:
+            return
+        if self.events and self.events[-1][0] == "text":
+            self.events[-1] = ("text", self.events[-1][1] + data)
+        else:
+            self.events.append(("text", data))
+
+    def handle_comment(self, data):
+        self.other.append(("comment", data))
+
+    def handle_decl(self, decl):
+        self.other.append(("decl", decl))
+
+    def unknown_decl(self, data):
+        self.other.append(("decl", data))
+
+    def handle_pi(self, data):
+        self.other.append(("pi", data))
+
+
+def events(html: str) -> _Events:
+    parser = _Events()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def _uri_ok(value: str) -> bool:
+    # bleach's own check; it decodes entities first, so give it the value
+    # re-escaped, i.e. exactly what the browser resolves
+    return BleachSanitizerFilter.sanitize_uri_value(None, escape(value), ALLOWED_PROTOCOLS) is not None
+
+
+def check_invariants(html_out: str) -> list:
+    problems = []
+    parsed = events(html_out)
+    if parsed.other:
+        problems.append(f"non-element markup survived: {parsed.other[:3]}")
+    if parsed.depth_errors or parsed.stack:
+        problems.append("unbalanced output")
+    for ev in parsed.events[1:]:  # skip the lark-article wrapper
+        if ev[0] != "start":
+            continue
+        _, tag, attrs = ev
+        if tag not in ALLOWED_TAGS:
+            problems.append(f"tag not allowed: {tag}")
+        allowed = set(ALLOWED_ATTRS.get(tag, []))
+        for name, value in attrs:
+            if name not in allowed:
+                problems.append(f"attribute not allowed: {tag}[{name}]")
+            if name in ("href", "src") and not _uri_ok(value):
+                problems.append(f"unsafe URI kept: {tag}[{name}]={value!r}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Differential fuzz test of the fast sanitizer against bleach")
+    parser.add_argument("--iterations", type=int, default=2000, help="Documents per mode")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--show", type=int, default=3, help="Failing cases to print")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    failures = []
+    for i in range(args.iterations):
+        doc = parity_doc(rnd)
+        fast = sanitize_and_inject_css(doc, backend="fast")
+        ref = sanitize_and_inject_css(doc, backend="bleach")
+        problems = check_invariants(fast)
+        if events(fast).events != events(ref).events:
+            problems.append("differs from bleach")
+        if problems:
+            failures.append(("parity", i, doc, fast, ref, problems))
+
+    for i in range(args.iterations):
+        doc = hostile_doc(rnd)
+        fast = sanitize_and_inject_css(doc, backend="fast")
+        problems = check_invariants(fast)
+        # bleach must accept the hostile input too (sanity check of the harness)
+        ref = sanitize_and_inject_css(doc, backend="bleach")
+        if problems:
+            failures.append(("hostile", i, doc, fast, ref, problems))
+
+    for mode, i, doc, fast, ref, problems in failures[: args.show]:
+        print(f"--- {mode} #{i}: {'; '.join(problems[:5])}")
+        print(f"input:  {doc!r:.600}")
+        print(f"fast:   {fast!r:.600}")
+        print(f"bleach: {ref!r:.600}")
+    print(f"{2 * args.iterations} documents, {len(failures)} failing (seed {args.seed})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""Load test for the HTTP API.
+
+Starts `app.main:app` under uvicorn with a throwaway SQLite database and
+working directory, either in this process (`--server thread`) or as a child
+process (`--server process`, optionally with several workers), or targets an
+already running instance (`--url`). Requests are drawn from a weighted mix
+of POST /convert, POST /documents/upload, GET /documents and
+GET /documents/{id}:
+
+- closed loop (default): `--concurrency` clients send back to back;
+- open loop (`--rate R`): R arrivals per second (Poisson) served by up to
+  `--concurrency` clients; latency counts from the scheduled arrival, so
+  queueing in the load generator is not hidden.
+
+Pandoc is the real binary when one is on PATH (`--pandoc auto`), otherwise
+the deterministic stub in scripts/stub_pandoc.py. Every `--interval` seconds
+a line reports throughput, latency percentiles, errors, server CPU/RSS
+(Linux /proc, including Pandoc children) and the conversion queue from
+`GET /metrics`; the run ends with a per-endpoint summary. `--json` writes
+the timeline and summary for comparisons, and `--max-p95-ms` /
+`--max-error-rate` turn the run into a regression check (exit 1).
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Ensure project root on sys.path
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+OPS = ("convert", "upload", "list", "detail")
+DEFAULT_MIX = "convert=1,upload=1,list=4,detail=4"
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r} (expected one of {', '.join(OPS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad weight in {item!r}")
+    if not any(w > 0 for w in mix.values()):
+        raise argparse.ArgumentTypeError("mix needs at least one positive weight")
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# --- server -----------------------------------------------------------------
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pandoc_dir(mode: str, workdir: Path) -> Tuple[Optional[Path], str]:
+    """Directory to prepend to PATH (None: leave PATH alone) and a label."""
+
+    real = shutil.which("pandoc")
+    if mode == "real" or (mode == "auto" and real):
+        if not real:
+            raise SystemExit("--pandoc real: no pandoc on PATH")
+        return None, f"real ({real})"
+    bindir = workdir / "bin"
+    bindir.mkdir(parents=True, exist_ok=True)
+    wrapper = bindir / "pandoc"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{ROOT / "scripts" / "stub_pandoc.py"}" "$@"\n')
+    wrapper.chmod(0o755)
+    return bindir, "stub"
+
+
+class Server:
+    """uvicorn serving app.main:app on a free local port."""
+
+    def __init__(self, mode: str, workdir: Path, env: Dict[str, str], workers: int = 1):
+        self.mode = mode
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.pid = os.getpid()
+        self._proc: Optional[subprocess.Popen] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        if mode == "thread":
+            # app.main reads its configuration from the environment and
+            # writes public/assets and out/ relative to the cwd
+            os.environ.update(env)
+            os.chdir(workdir)
+            import uvicorn
+            from app.main import app
+
+            config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+            self._server = uvicorn.Server(config)
+            self._thread = threading.Thread(target=self._server.run, daemon=True)
+            self._thread.start()
+        else:
+            args = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                    "--port", str(self.port), "--log-level", "warning", "--workers", str(workers)]
+            child_env = dict(os.environ, **env)
+            child_env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), child_env.get("PYTHONPATH")]))
+            self._proc = subprocess.Popen(args, cwd=workdir, env=child_env)
+            self.pid = self._proc.pid
+        self._wait_ready()
+
+    def _wait_ready(self, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._proc is not None and self._proc.poll() is not None:
+                raise SystemExit(f"server exited with code {self._proc.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise SystemExit(f"server did not start within {timeout:g}s")
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+        if self._proc is not None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+
+
+class ProcSampler:
+    """CPU and RSS of a process tree from /proc; no-op elsewhere."""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.enabled = pid is not None and Path(f"/proc/{pid}/stat").exists()
+        self._last: Optional[Tuple[float, float]] = None
+
+    def _tree(self) -> List[int]:
+        children: Dict[int, List[int]] = {}
+        for entry in Path("/proc").iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                stat = (entry / "stat").read_text()
+            except OSError:
+                continue
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry.name))
+        pids, todo = [], [self.pid]
+        while todo:
+            pid = todo.pop()
+            pids.append(pid)
+            todo.extend(children.get(pid, ()))
+        return pids
+
+    def sample(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {}
+        cpu_ticks, rss_kb, procs = 0, 0, 0
+        for pid in self._tree():
+            try:
+                fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+                status = Path(f"/proc/{pid}/status").read_text()
+            except OSError:
+                continue
+            # utime, stime, cutime, cstime (fields 14-17 of stat, after pid
+            # and comm); the last two cover Pandoc runs already reaped
+            cpu_ticks += sum(int(f) for f in fields[11:15])
+            for line in status.splitlines():
+                if line.startswith("VmRSS:"):
+                    rss_kb += int(line.split()[1])
+                    break
+            procs += 1
+        now, cpu = time.monotonic(), cpu_ticks / _CLK_TCK
+        out: Dict[str, Any] = {"rss_mb": round(rss_kb / 1024, 1), "procs": procs}
+        if self._last is not None:
+            elapsed = now - self._last[0]
+            out["cpu_pct"] = round(100 * max(0.0, cpu - self._last[1]) / elapsed, 1) if elapsed > 0 else 0.0
+        self._last = (now, cpu)
+        return out
+
+
+# --- client -----------------------------------------------------------------
+
+
+def _multipart(fields: Dict[str, str], filename: str, data: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: application/vnd.openxmlformats-officedocument.wordprocessingml.document\r\n\r\n".encode()
+    )
+    parts.append(data)
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """One keep-alive connection; reconnects after errors."""
+
+    def __init__(self, base_url: str, timeout: float):
+        u = urlsplit(base_url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 80
+        self.prefix = u.path.rstrip("/")
+        self.timeout = timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, content_type: Optional[str] = None) -> Tuple[int, bytes]:
+        headers = {"Content-Type": content_type} if content_type else {}
+        # The server drops idle keep-alive connections (uvicorn: after 5s);
+        # a reused connection that turns out closed is retried once
+        retried = False
+        while True:
+            reused = self.conn is not None
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, self.prefix + path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.conn.close()
+                self.conn = None
+                if not reused or retried:
+                    raise
+                retried = True
+            except Exception:
+                self.conn.close()
+                self.conn = None
+                raise
+
+
+class Workload:
+    """Builds and runs one operation of the mix; shared by all clients."""
+
+    def __init__(self, docs: List[Path], doc_ids: int):
+        self.docs = [(p.name, p.read_bytes()) for p in docs]
+        self.doc_ids = doc_ids
+        self.ids: List[int] = []
+        self._lock = threading.Lock()
+        self._n = 0
+
+    def _next(self) -> int:
+        with self._lock:
+            self._n += 1
+            return self._n
+
+    def seed(self, client: Client) -> None:
+        """Upload each document once so GET /documents/{id} has targets."""
+
+        for i in range(len(self.docs)):
+            status, _ = self.run(client, "upload", i)
+            if status != 200:
+                raise SystemExit(f"seeding upload failed with HTTP {status}")
+
+    def run(self, client: Client, op: str, n: Optional[int] = None) -> Tuple[int, int]:
+        """Perform `op`; returns (status, response bytes)."""
+
+        n = self._next() if n is None else n
+        if op in ("convert", "upload"):
+            name, data = self.docs[n % len(self.docs)]
+            doc_id = f"load-{n % self.doc_ids}"
+            fields = {"doc_id": doc_id} if op == "convert" else {"doc_id": doc_id, "title": f"Load test {doc_id}"}
+            body, ctype = _multipart(fields, name, data)
+            status, payload = client.request("POST", "/convert" if op == "convert" else "/documents/upload", body, ctype)
+            if op == "upload" and status == 200:
+                with self._lock:
+                    self.ids.append(json.loads(payload)["id"])
+            return status, len(payload)
+        if op == "list":
+            status, payload = client.request("GET", "/documents")
+            return status, len(payload)
+        with self._lock:
+            doc = random.choice(self.ids) if self.ids else 1
+        status, payload = client.request("GET", f"/documents/{doc}")
+        return status, len(payload)
+
+
+# --- measurement ------------------------------------------------------------
+
+
+class Recorder:
+    """Thread-safe result log: (finish time, op, status key, latency ms, bytes)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.results: List[Tuple[float, str, str, float, int]] = []
+
+    def add(self, op: str, status: str, latency_ms: float, size: int) -> None:
+        with self._lock:
+            self.results.append((time.monotonic(), op, status, latency_ms, size))
+
+    def since(self, start: int) -> List[Tuple[float, str, str, float, int]]:
+        with self._lock:
+            return self.results[start:]
+
+
+def summarize(results: List[Tuple[float, str, str, float, int]], seconds: float) -> Dict[str, Any]:
+    lat = sorted(r[3] for r in results)
+    errors = sum(1 for r in results if not r[2].startswith("2"))
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[r[2]] = statuses.get(r[2], 0) + 1
+    return {
+        "requests": len(results),
+        "rps": round(len(results) / seconds, 2) if seconds > 0 else 0.0,
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "p50_ms": round(percentile(lat, 50), 1),
+        "p90_ms": round(percentile(lat, 90), 1),
+        "p95_ms": round(percentile(lat, 95), 1),
+        "p99_ms": round(percentile(lat, 99), 1),
+        "max_ms": round(lat[-1], 1) if lat else 0.0,
+        "statuses": statuses,
+    }
+
+
+def _server_metrics(client: Client) -> Dict[str, Any]:
+    try:
+        status, payload = client.request("GET", "/metrics")
+    except Exception:
+        return {}
+    if status != 200:
+        return {}
+    conversion = json.loads(payload).get("conversion", {})
+    return {
+        "running": sum(conversion.get("running", {}).values()),
+        "queued": sum(conversion.get("queued", {}).values()),
+        "throttled": sum(conversion.get("throttled", {}).values()),
+    }
+
+
+def _driver(args, workload: Workload, recorder: Recorder, base_url: str, stop: threading.Event) -> List[threading.Thread]:
+    ops = [op for op in OPS if args.mix.get(op, 0) > 0]
+    weights = [args.mix[op] for op in ops]
+    budget = threading.Semaphore(args.requests) if args.requests else None
+    arrivals: "List[float]" = []
+    arrivals_cv = threading.Condition()
+
+    def one(client: Client, scheduled: float) -> None:
+        op = random.choices(ops, weights)[0]
+        try:
+            status, size = workload.run(client, op)
+            key = str(status)
+        except Exception as e:
+            key, size = f"exc:{type(e).__name__}", 0
+        recorder.add(op, key, 1000 * (time.monotonic() - scheduled), size)
+
+    def take() -> bool:
+        return budget is None or budget.acquire(blocking=False)
+
+    def closed_loop() -> None:
+        client = Client(base_url, args.timeout)
+        while not stop.is_set() and take():
+            one(client, time.monotonic())
+
+    def open_loop_client() -> None:
+        client = Client(base_url, args.timeout)
+        while True:
+            with arrivals_cv:
+                while not arrivals and not stop.is_set():
+                    arrivals_cv.wait(0.1)
+                if stop.is_set():
+                    return
+                scheduled = arrivals.pop(0)
+            one(client, scheduled)
+
+    def arrival_clock() -> None:
+        t = time.monotonic()
+        while not stop.is_set() and take():
+            t += random.expovariate(args.rate)
+            delay = t - time.monotonic()
+            if delay > 0 and stop.wait(delay):
+                return
+            with arrivals_cv:
+                arrivals.append(t)
+                arrivals_cv.notify()
+
+    if args.rate:
+        threads = [threading.Thread(target=arrival_clock, daemon=True)]
+        threads += [threading.Thread(target=open_loop_client, daemon=True) for _ in range(args.concurrency)]
+    else:
+        threads = [threading.Thread(target=closed_loop, daemon=True) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test /convert, /documents/upload, /documents and /documents/{id}")
+    parser.add_argument("--docx", nargs="+", type=Path, default=None, help="Documents to upload (default: the sample .docx files in the repo root)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients (default: 4)")
+    parser.add_argument("--rate", type=float, default=None, help="Open loop: arrivals per second (default: closed loop)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run (default: 30)")
+    parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests instead")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between progress lines (default: 5)")
+    parser.add_argument("--server", choices=["thread", "process"], default="process", help="Run uvicorn in this process or a child (default: process)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --server process (default: 1)")
+    parser.add_argument("--url", type=str, default=None, help="Target an already running server instead (no resource sampling unless --pid)")
+    parser.add_argument("--pid", type=int, default=None, help="Server pid to sample with --url")
+    parser.add_argument("--pandoc", choices=["auto", "stub", "real"], default="auto", help="Real pandoc when on PATH, else the stub (default: auto)")
+    parser.add_argument("--stub-ms", type=float, default=0.0, help="Stub Pandoc delay per conversion in ms (STUB_PANDOC_MS)")
+    parser.add_argument("--doc-ids", type=int, default=20, help="Distinct doc_ids that uploads cycle through (default: 20)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--workdir", type=Path, default=None, help="Server cwd and SQLite location (default: a temp dir, removed afterwards)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the operation mix")
+    parser.add_argument("--json", type=Path, default=None, help="Write timeline and summary as JSON")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Fail if the overall p95 latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="Fail if the overall error rate exceeds this (0-1)")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    docs = args.docx or sorted(ROOT.glob("*.docx"))
+    if not docs:
+        print("No .docx files given and none found in the repo root", file=sys.stderr)
+        return 2
+    docs = [p.resolve() for p in docs]
+    workload = Workload(docs, max(1, args.doc_ids))
+
+    own_workdir = args.workdir is None
+    workdir = Path(tempfile.mkdtemp(prefix="fei2html-load-")) if own_workdir else args.workdir.resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    server: Optional[Server] = None
+    cwd = os.getcwd()
+    try:
+        if args.url:
+            base_url, pid, pandoc_label = args.url, args.pid, "external"
+        else:
+            bindir, pandoc_label = _pandoc_dir(args.pandoc, workdir)
+            env = {"FEI2HTML_DB_URL": f"sqlite:///{workdir / 'load.db'}"}
+            if bindir is not None:
+                env["PATH"] = os.pathsep.join([str(bindir), os.environ.get("PATH", "")])
+                env["STUB_PANDOC_MS"] = str(args.stub_ms)
+            server = Server(args.server, workdir, env, workers=args.workers)
+            base_url, pid = server.url, server.pid
+        print(f"target {base_url}  pandoc {pandoc_label}  docs {', '.join(p.name for p in docs)}")
+        mode = f"open loop {args.rate:g}/s" if args.rate else "closed loop"
+        limit = f"{args.requests} requests" if args.requests else f"{args.duration:g}s"
+        print(f"{mode}, concurrency {args.concurrency}, {limit}, mix {args.mix}")
+
+        control = Client(base_url, args.timeout)
+        if args.mix.get("detail"):
+            workload.seed(control)
+        sampler = ProcSampler(pid)
+        sampler.sample()
+
+        recorder = Recorder()
+        stop = threading.Event()
+        started = time.monotonic()
+        threads = _driver(args, workload, recorder, base_url, stop)
+        timeline: List[Dict[str, Any]] = []
+        seen = 0
+        last = started
+        print(f"{'t':>6} {'rps':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'cpu%':>6} {'rss_mb':>7} {'run':>4} {'queue':>5}")
+        while True:
+            deadline = started + args.duration if not args.requests else None
+            wait = args.interval if deadline is None else min(args.interval, max(0.0, deadline - time.monotonic()))
+            stop.wait(wait)
+            done = (deadline is not None and time.monotonic() >= deadline) or not any(t.is_alive() for t in threads)
+            if args.requests and len(recorder.results) >= args.requests:
+                done = True
+            now = time.monotonic()
+            batch = recorder.since(seen)
+            seen += len(batch)
+            point = {"t": round(now - started, 1), **summarize(batch, now - last), **sampler.sample(), **_server_metrics(control)}
+            point.pop("statuses")
+            timeline.append(point)
+            last = now
+            print(
+                f"{point['t']:6.1f} {point['rps']:7.2f} {100 * point['error_rate']:6.2f} {point['p50_ms']:8.1f} "
+                f"{point['p95_ms']:8.1f} {point['p99_ms']:8.1f} {point.get('cpu_pct', '-'):>6} {point.get('rss_mb', '-'):>7} "
+                f"{point.get('running', '-'):>4} {point.get('queued', '-'):>5}"
+            )
+            if done:
+                break
+        stop.set()
+        for t in threads:
+            t.join(timeout=args.timeout)
+        elapsed = time.monotonic() - started
+
+        results = recorder.since(0)
+        summary = {"all": summarize(results, elapsed)}
+        for op in OPS:
+            rows = [r for r in results if r[1] == op]
+            if rows:
+                summary[op] = summarize(rows, elapsed)
+        print(f"\n{'endpoint':<9} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}  statuses")
+        for name, s in summary.items():
+            print(
+                f"{name:<9} {s['requests']:6d} {s['rps']:7.2f} {100 * s['error_rate']:6.2f} {s['p50_ms']:8.1f} {s['p90_ms']:8.1f} "
+                f"{s['p95_ms']:8.1f} {s['p99_ms']:8.1f} {s['max_ms']:8.1f}  {s['statuses']}"
+            )
+
+        if args.json:
+            args.json.parent.mkdir(parents=True, exist_ok=True)
+            config = {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k != "json"}
+            config.update(docx=[str(p) for p in docs], pandoc=pandoc_label, elapsed_s=round(elapsed, 2))
+            args.json.write_text(json.dumps({"config": config, "timeline": timeline, "summary": summary}, indent=2, ensure_ascii=False))
+
+        failed = False
+        overall = summary["all"]
+        if args.max_p95_ms is not None and overall["p95_ms"] > args.max_p95_ms:
+            print(f"FAIL: p95 {overall['p95_ms']:.0f} ms exceeds {args.max_p95_ms:.0f} ms")
+            failed = True
+        if args.max_error_rate is not None and overall["error_rate"] > args.max_error_rate:
+            print(f"FAIL: error rate {overall['error_rate']:.2%} exceeds {args.max_error_rate:.2%}")
+            failed = True
+        return 1 if failed else 0
+    finally:
+        if server is not None:
+            server.stop()
+        os.chdir(cwd)
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
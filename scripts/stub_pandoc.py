@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Deterministic stand-in for `pandoc` used by scripts/loadtest.py.
+
+Understands the command lines PandocConverter builds (`--from docx --to
+html5|json --extract-media DIR FILE`) and `--version`. Output is derived from
+word/document.xml: one paragraph or heading per body paragraph, images where
+drawings reference media, so the post-processing, sanitizing and storage
+stages see realistic input while conversion time stays predictable.
+
+STUB_PANDOC_MS adds a fixed delay per conversion and STUB_PANDOC_MS_PER_MB
+one proportional to the size of document.xml, to stand in for real Pandoc
+latency (sleeping, not burning CPU).
+"""
+from __future__ import annotations
+
+import html
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from typing import List, Optional, Tuple
+
+_P_RE = re.compile(rb"<w:p[ >].*?</w:p>", re.S)
+_T_RE = re.compile(rb"<w:t(?: [^>]*)?>([^<]*)</w:t>")
+_OUTLINE_RE = re.compile(rb'<w:outlineLvl w:val="(\d)"')
+_EMBED_RE = re.compile(rb'r:embed="([^"]+)"')
+_REL_RE = re.compile(rb'<Relationship\b[^>]*\bId="([^"]+)"[^>]*\bTarget="([^"]+)"')
+
+
+def _paragraphs(zf: zipfile.ZipFile, media_dir: str) -> List[Tuple[int, str, List[str]]]:
+    """(heading level or 0, text, extracted image paths) per paragraph."""
+
+    xml = zf.read("word/document.xml")
+    rels = {}
+    if "word/_rels/document.xml.rels" in zf.namelist():
+        rels = {k.decode(): v.decode() for k, v in _REL_RE.findall(zf.read("word/_rels/document.xml.rels"))}
+    extracted = {}
+    out = []
+    for m in _P_RE.finditer(xml):
+        p = m.group(0)
+        text = html.unescape(b"".join(_T_RE.findall(p)).decode("utf-8"))
+        level = _OUTLINE_RE.search(p)
+        images = []
+        for rid in _EMBED_RE.findall(p):
+            target = rels.get(rid.decode(), "")
+            if not target.startswith("media/"):
+                continue
+            if target not in extracted:
+                dest = os.path.join(media_dir, "media", os.path.basename(target))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, "wb") as f:
+                    f.write(zf.read("word/" + target))
+                extracted[target] = dest
+            images.append(extracted[target])
+        out.append((int(level.group(1)) + 1 if level else 0, text, images))
+    return out
+
+
+def _to_html(paras: List[Tuple[int, str, List[str]]]) -> str:
+    out = []
+    for level, text, images in paras:
+        body = html.escape(text, quote=False) + "".join(
+            f'<img src="{html.escape(src)}" style="width:6in" />' for src in images
+        )
+        if level and level <= 6:
+            out.append(f"<h{level}>{body}</h{level}>")
+        elif body:
+            out.append(f"<p>{body}</p>")
+    return "\n".join(out)
+
+
+def _to_json(paras: List[Tuple[int, str, List[str]]]) -> str:
+    blocks = []
+    for level, text, images in paras:
+        inlines: list = []
+        for i, word in enumerate(text.split()):
+            if i:
+                inlines.append({"t": "Space"})
+            inlines.append({"t": "Str", "c": word})
+        for src in images:
+            inlines.append({"t": "Image", "c": [["", [], []], [], [src, ""]]})
+        if level and level <= 6:
+            blocks.append({"t": "Header", "c": [level, ["", [], []], inlines]})
+        elif inlines:
+            blocks.append({"t": "Para", "c": inlines})
+    return json.dumps({"pandoc-api-version": [1, 23, 1], "meta": {}, "blocks": blocks}, ensure_ascii=False)
+
+
+def _arg(argv: List[str], name: str) -> Optional[str]:
+    return argv[argv.index(name) + 1] if name in argv else None
+
+
+def main(argv: List[str]) -> int:
+    if "--version" in argv:
+        print("pandoc 3.1.11 (stub)")
+        return 0
+    src = argv[-1]
+    try:
+        with zipfile.ZipFile(src) as zf:
+            size_mb = zf.getinfo("word/document.xml").file_size / (1 << 20)
+            paras = _paragraphs(zf, _arg(argv, "--extract-media") or ".")
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        print(f"stub pandoc: {e}", file=sys.stderr)
+        return 1
+    delay_ms = float(os.getenv("STUB_PANDOC_MS") or 0) + float(os.getenv("STUB_PANDOC_MS_PER_MB") or 0) * size_mb
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000)
+    out = _to_json(paras) if _arg(argv, "--to") == "json" else _to_html(paras)
+    # Pandoc always writes UTF-8, whatever the locale
+    sys.stdout.buffer.write(out.encode("utf-8"))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))